@@ -1,231 +1,590 @@
 import socket
 import os
+import json
+import struct
 import threading
+import time
+import queue
+import selectors
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard  # optional: compresses large payloads on the wire
+except ImportError:
+    zstandard = None
 
 # ---------------- CONFIG ----------------
 BACKUP_SERVER_IP = "0.0.0.0"
 BACKUP_PORT = 9001
 STORAGE_DIR = "Storage"
+MAX_WORKERS = (os.cpu_count() or 1) * 4  # commands served concurrently
+IDLE_TIMEOUT = 30  # seconds an idle connection is kept open
+IDLE_SWEEP_INTERVAL = 5  # seconds between scans for idle connections
+CHUNK_SIZE = 64 * 1024  # bytes per socket recv
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # SO_RCVBUF/SO_SNDBUF for data sockets
+FRAME_HEADER = struct.Struct("!IQB")  # sequence number, length and flags before every message and payload
+FLAG_ZSTD = 1  # the frame's payload is zstd-compressed
+FLAG_ACCEPTS_ZSTD = 2  # the sender can decode zstd-compressed payloads
+COMPRESS_MIN_SIZE = 16 * 1024  # smaller payloads are sent as they are
+COMPRESS_LEVEL = 3  # zstd level: fast, and still shrinks text several times
+MAX_FRAME_SIZE = 1024 * 1024 * 1024  # largest command, payload or file body accepted
+FILE_BUFFER_SIZE = 1024 * 1024  # buffer for reading and writing stored files
+DURABILITY = "fdatasync"  # "fdatasync" syncs every write before replying, "none" leaves it to the OS
+DONTNEED_SIZE = 64 * 1024 * 1024  # synced files this large are dropped from the page cache
+TEMP_SUFFIX = ".dfstmp"  # marks files still being written
+READ_CACHE_SIZE = 128 * 1024 * 1024  # max bytes of file contents kept in memory for READ
+HAVE_SENDMSG = hasattr(socket.socket, "sendmsg")  # vectored send, missing on Windows
+FRAME_FLAGS = FLAG_ACCEPTS_ZSTD if zstandard else 0  # set on every frame sent
+fdatasync = getattr(os, "fdatasync", os.fsync)  # fdatasync is missing on macOS and Windows
+O_BINARY = getattr(os, "O_BINARY", 0)  # Windows would otherwise translate newlines
 
 os.makedirs(STORAGE_DIR, exist_ok=True)
+STORAGE_REAL = os.path.realpath(STORAGE_DIR)  # resolved once, not per request
+
+# Names of stored files, kept up to date by the write and delete paths
+# so LIST does not have to read the directory each time
+listing = {name for name in os.listdir(STORAGE_DIR) if not name.endswith(TEMP_SUFFIX)}
+listing_lock = threading.Lock()
+encode_json = json.JSONEncoder(separators=(",", ":")).encode  # compact LIST replies, built once
 
 file_locks = {}
 
 def get_lock(filename):
-    if filename not in file_locks:
-        file_locks[filename] = threading.Lock()
-    return file_locks[filename]
+    # setdefault is atomic, so threads racing to create the lock all get
+    # the one that was stored first
+    return file_locks.setdefault(filename, threading.Lock())
+
+# Recently read files, least recently used first. Entries are keyed by
+# (filename, inode, mtime) and never modified: every write replaces the
+# file with a new inode, so a stale entry is simply never hit again and
+# ages out of the cache.
+read_cache = OrderedDict()
+read_cache_bytes = 0
+read_cache_lock = threading.Lock()
+
+def read_cache_get(key):
+    """Return cached contents for key, or None"""
+    with read_cache_lock:
+        data = read_cache.get(key)
+        if data is not None:
+            read_cache.move_to_end(key)
+        return data
+
+def read_cache_put(key, data):
+    """Cache contents for key, evicting old entries beyond READ_CACHE_SIZE"""
+    global read_cache_bytes
+    if len(data) > READ_CACHE_SIZE:
+        return
+    with read_cache_lock:
+        if key in read_cache:
+            return
+        read_cache[key] = data
+        read_cache_bytes += len(data)
+        while read_cache_bytes > READ_CACHE_SIZE:
+            _, old = read_cache.popitem(last=False)
+            read_cache_bytes -= len(old)
+
+def tune_socket(sock):
+    """Enlarge kernel socket buffers and disable Nagle's algorithm"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if hasattr(socket, "TCP_QUICKACK"):
+        # Linux only: acknowledge small commands and replies straight away
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+def recv_exact(rfile, size):
+    """Read exactly size bytes from a buffered socket reader"""
+    # readinto() keeps reading until the buffer is full, so short reads
+    # from the socket never leak out as partial messages
+    buf = bytearray(size)
+    if rfile.readinto(buf) != size:
+        raise ConnectionError("Connection closed before all data was received")
+    return buf
+
+def encode_payload(data, peer_accepts_zstd):
+    """Return the bytes to send for data and the frame flags describing them"""
+    if zstandard and peer_accepts_zstd and len(data) >= COMPRESS_MIN_SIZE:
+        packed = zstandard.ZstdCompressor(level=COMPRESS_LEVEL).compress(data)
+        if len(packed) < len(data):
+            return packed, FRAME_FLAGS | FLAG_ZSTD
+    return data, FRAME_FLAGS
+
+def decode_payload(payload, flags):
+    """Undo the compression described by a frame's flags"""
+    if not flags & FLAG_ZSTD:
+        return payload
+    if zstandard is None:
+        raise ValueError("Received a compressed payload but zstandard is not installed")
+    # Our compressed frames always record their size; check it before allocating
+    size = zstandard.frame_content_size(payload)
+    if not 0 <= size <= MAX_FRAME_SIZE:
+        raise ValueError("Compressed payload has a missing or oversized content size")
+    try:
+        return zstandard.ZstdDecompressor().decompress(payload)
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Invalid compressed payload: {str(e)}")
+
+def recv_frame(rfile):
+    """Receive a frame and return its sequence number, payload and flags"""
+    seq, size, flags = FRAME_HEADER.unpack(recv_exact(rfile, FRAME_HEADER.size))
+    if size > MAX_FRAME_SIZE:
+        # Not a frame from our clients; the stream cannot be resynchronised
+        raise ConnectionError(f"Frame of {size} bytes exceeds limit")
+    return seq, decode_payload(recv_exact(rfile, size), flags), flags
+
+def split_sized(args):
+    """Split "<filename> <size>" arguments of a command followed by a body"""
+    # The size is the last word, so it is found even if the name has spaces
+    filename, _, size = args.rpartition(" ")
+    try:
+        return filename, int(size)
+    except ValueError:
+        # Without a valid size the body cannot be skipped, so the stream
+        # cannot be resynchronised
+        raise ConnectionError(f"Invalid body size: {size!r}")
+
+def recv_body(rfile, size):
+    """Receive a raw body whose size was given in the command"""
+    if not 0 <= size <= MAX_FRAME_SIZE:
+        # Checked before the buffer is allocated; the body cannot be
+        # skipped without reading it, so the stream cannot be resynchronised
+        raise ConnectionError(f"Body of {size} bytes exceeds limit")
+    return recv_exact(rfile, size)
+
+def recv_payload(rfile):
+    """Receive a frame and return only its payload"""
+    return recv_frame(rfile)[1]
+
+def recv_file(rfile, size):
+    """Receive a file sent as one frame after its command, size being its
+    uncompressed length as given in the command"""
+    if not 0 <= size <= MAX_FRAME_SIZE:
+        # Checked before the buffer is allocated; the body cannot be
+        # skipped without reading it, so the stream cannot be resynchronised
+        raise ConnectionError(f"Body of {size} bytes exceeds limit")
+    data = recv_payload(rfile)
+    if len(data) != size:
+        raise ValueError(f"Expected {size} bytes but received {len(data)}")
+    return data
+
+# Sequence number of the command each worker thread is serving, and
+# whether its sender accepts compressed replies. Replies echo the sequence
+# number so a client can send several commands before reading any reply.
+current = threading.local()
+
+def send_payload(sock, data):
+    """Send a payload prefixed with the current sequence number and its length"""
+    data, flags = encode_payload(data, getattr(current, "accepts_zstd", False))
+    header = FRAME_HEADER.pack(getattr(current, "seq", 0), len(data), flags)
+    if not HAVE_SENDMSG:
+        sock.sendall(header + data)
+        return
+    
+    # Gather header and payload into one syscall without first copying
+    # the payload into a new buffer; loop in case only part is sent
+    buffers = [memoryview(header), memoryview(data)]
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if buffers:
+            buffers[0] = buffers[0][sent:]
+
+def send_file(sock, f):
+    """Send the contents of an open file as one frame without reading it into memory"""
+    size = os.fstat(f.fileno()).st_size
+    if zstandard and getattr(current, "accepts_zstd", False) and size >= COMPRESS_MIN_SIZE:
+        # Compression needs the contents in memory, so skip the zero-copy send
+        send_payload(sock, f.read())
+        return
+    sock.sendall(FRAME_HEADER.pack(getattr(current, "seq", 0), size, FRAME_FLAGS))
+    sock.sendfile(f, 0, size)
+
+def resolve_path(filename):
+    """Return the storage path for filename, refusing names that escape STORAGE_DIR"""
+    filepath = os.path.realpath(os.path.join(STORAGE_REAL, filename))
+    if not filepath.startswith(STORAGE_REAL + os.sep):
+        raise ValueError(f"Invalid filename: {filename}")
+    return filepath
+
+def sync_dir(path):
+    """Flush a directory's entries to disk, where directories can be opened"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # Windows cannot open a directory this way
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_atomic(filepath, data):
+    """Write data to a temp file and rename it over filepath, so readers
+    only ever see the old or the new contents"""
+    tmp = f"{filepath}.{threading.get_ident()}{TEMP_SUFFIX}"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        if DURABILITY == "fdatasync":
+            # The reply is only sent once the data is on disk
+            fdatasync(fd)
+            if len(data) >= DONTNEED_SIZE and hasattr(os, "posix_fadvise"):
+                # The pages are clean now; let large files leave the page cache
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except BaseException:
+        os.close(fd)
+        os.remove(tmp)
+        raise
+    os.close(fd)
+    os.replace(tmp, filepath)
+    if DURABILITY == "fdatasync":
+        # The rename is only durable once the directory entry is on disk too
+        sync_dir(os.path.dirname(filepath))
 
 # ---------------- CLIENT/REPLICATION HANDLER ----------------
-def handle_request(client_socket, addr):
-    print(f"[+] Connection from: {addr}")
+# -------- LIST --------
+def handle_list(client_socket, rfile, args, addr):
+    """Send the names of all stored files"""
+    with listing_lock:
+        files = sorted(listing)
+    send_payload(client_socket, encode_json(files).encode())
+    print(f"[+] Served LIST to: {addr}")
+
+# -------- READ --------
+def handle_read(client_socket, rfile, args, addr):
+    """Send the contents of a text file"""
+    [filename] = args.split()
+    filepath = resolve_path(filename)
     
+    # No lock needed: writers replace the file atomically, so a single
+    # stat tells whether the cached copy is still current
     try:
-        command = client_socket.recv(1024).decode().strip()
-        
-        # -------- LIST --------
-        if command == "LIST":
-            files = os.listdir(STORAGE_DIR)
-            client_socket.send(str(files).encode())
-            print(f"[+] Served LIST to: {addr}")
-        
-        # -------- READ --------
-        elif command.startswith("READ"):
-            _, filename = command.split()
-            filepath = os.path.join(STORAGE_DIR, filename)
-            
-            if not os.path.exists(filepath):
-                client_socket.send("ERROR: File not found".encode())
-                return
-            
-            lock = get_lock(filename)
-            with lock:
-                with open(filepath, "r") as f:
-                    data = f.read()
-            
-            client_socket.send(data.encode())
-            print(f"[+] Served READ {filename} to: {addr}")
-        
-        # -------- WRITE --------
-        elif command.startswith("WRITE"):
-            _, filename = command.split()
-            filepath = os.path.join(STORAGE_DIR, filename)
-
-            lock = get_lock(filename)
-            client_socket.send("READY".encode())
-
-            data = ""
-            while True:
-                chunk = client_socket.recv(4096).decode()
-                if chunk == "<<EOF>>":
-                    break
-                data += chunk
-
-            with lock:
-                with open(filepath, "w") as f:
-                    f.write(data)
-
-            client_socket.send("Write successful (backup server)".encode())
-            print(f"[+] WRITE {filename} from: {addr}")
-        
-        # -------- APPEND --------
-        elif command.startswith("APPEND"):
-            _, filename = command.split()
-            filepath = os.path.join(STORAGE_DIR, filename)
-
-            lock = get_lock(filename)
-            client_socket.send("READY".encode())
-
-            data = ""
-            while True:
-                chunk = client_socket.recv(4096).decode()
-                if chunk == "<<EOF>>":
-                    break
-                data += chunk
-
-            with lock:
-                with open(filepath, "a") as f:
-                    f.write(data)
-
-            client_socket.send("Append successful (backup server)".encode())
-            print(f"[+] APPEND {filename} from: {addr}")
-        
-        # -------- DELETE --------
-        elif command.startswith("DELETE"):
-            _, filename = command.split()
-            filepath = os.path.join(STORAGE_DIR, filename)
-            
-            if not os.path.exists(filepath):
-                client_socket.send("ERROR: File not found".encode())
-                return
-            
-            lock = get_lock(filename)
-            with lock:
-                os.remove(filepath)
-            
-            client_socket.send("Delete successful (backup server)".encode())
-            print(f"[+] DELETE {filename} from: {addr}")
-        
-        # -------- UPLOAD --------
-        elif command.startswith("UPLOAD"):
-            _, filename, filesize = command.split()
-            filesize = int(filesize)
-            filepath = os.path.join(STORAGE_DIR, filename)
-
-            lock = get_lock(filename)
-            client_socket.send("READY".encode())
-
-            # Receive file data
-            received = 0
-            file_data = b""
-            while received < filesize:
-                chunk = client_socket.recv(min(4096, filesize - received))
-                if not chunk:
-                    break
-                file_data += chunk
-                received += len(chunk)
-
-            with lock:
-                with open(filepath, "wb") as f:
-                    f.write(file_data)
-
-            client_socket.send(f"Upload successful (backup server): {filename} ({filesize} bytes)".encode())
-            print(f"[+] UPLOAD {filename} ({filesize} bytes) from: {addr}")
-        
-        # -------- DOWNLOAD --------
-        elif command.startswith("DOWNLOAD"):
-            _, filename = command.split()
-            filepath = os.path.join(STORAGE_DIR, filename)
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        send_payload(client_socket, "ERROR: File not found".encode())
+        return
+    
+    data = read_cache_get((filename, st.st_ino, st.st_mtime_ns))
+    if data is None:
+        try:
+            with open(filepath, "rb", buffering=FILE_BUFFER_SIZE) as f:
+                # Key by the opened file, which may be newer than the stat
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except FileNotFoundError:
+            send_payload(client_socket, "ERROR: File not found".encode())
+            return
+        read_cache_put((filename, st.st_ino, st.st_mtime_ns), data)
+    
+    send_payload(client_socket, data)
+    print(f"[+] Served READ {filename} to: {addr}")
 
-            if not os.path.exists(filepath):
-                client_socket.send("ERROR: File not found".encode())
-                return
+# -------- WRITE --------
+def handle_write(client_socket, rfile, args, addr):
+    """Overwrite or create a file with the received text"""
+    # The text follows the command directly; read it before anything can
+    # fail so the next command starts at a frame boundary
+    buf = recv_payload(rfile)
 
-            lock = get_lock(filename)
-            with lock:
-                filesize = os.path.getsize(filepath)
-                client_socket.send(f"READY {filesize}".encode())
-                
-                # Wait for client acknowledgment
-                ack = client_socket.recv(1024).decode()
-                if ack == "ACK":
-                    with open(filepath, "rb") as f:
-                        while True:
-                            chunk = f.read(4096)
-                            if not chunk:
-                                break
-                            client_socket.send(chunk)
-            
-            print(f"[+] DOWNLOAD {filename} ({filesize} bytes) to: {addr}")
-        
-        # -------- REPLICATE (from main server) --------
-        elif command.startswith("REPLICATE "):
-            _, filename = command.split(maxsplit=1)
-            filepath = os.path.join(STORAGE_DIR, filename)
-            
-            lock = get_lock(filename)
-            client_socket.send("READY".encode())
-            
-            data = ""
-            while True:
-                chunk = client_socket.recv(4096).decode()
-                if chunk == "<<EOF>>":
-                    break
-                data += chunk
-            
-            with lock:
-                with open(filepath, "w") as f:
-                    f.write(data)
-            
-            client_socket.send("Replication successful".encode())
-            print(f"[+] Replicated file: {filename}")
-        
-        # -------- REPLICATE BINARY (from main server) --------
-        elif command.startswith("REPLICATE_BINARY"):
-            parts = command.split()
-            filename = parts[1]
-            filesize = int(parts[2])
-            filepath = os.path.join(STORAGE_DIR, filename)
-            
-            lock = get_lock(filename)
-            client_socket.send("READY".encode())
-            
-            # Receive binary data
-            received = 0
-            file_data = b""
-            while received < filesize:
-                chunk = client_socket.recv(min(4096, filesize - received))
-                if not chunk:
-                    break
-                file_data += chunk
-                received += len(chunk)
-            
-            with lock:
-                with open(filepath, "wb") as f:
-                    f.write(file_data)
-            
-            client_socket.send("Binary replication successful".encode())
-            print(f"[+] Replicated binary file: {filename} ({filesize} bytes)")
+    [filename] = args.split()
+    filepath = resolve_path(filename)
+    lock = get_lock(filename)
+
+    with lock:
+        write_atomic(filepath, buf)
+        with listing_lock:
+            listing.add(filename)
+
+    send_payload(client_socket, "Write successful (backup server)".encode())
+    print(f"[+] WRITE {filename} from: {addr}")
+
+# -------- APPEND --------
+def handle_append(client_socket, rfile, args, addr):
+    """Add the received text to the end of a file"""
+    buf = recv_payload(rfile)
+
+    [filename] = args.split()
+    filepath = resolve_path(filename)
+    lock = get_lock(filename)
+
+    with lock:
+        # Rewrite the whole file so readers never see a half-applied append
+        try:
+            with open(filepath, "rb", buffering=FILE_BUFFER_SIZE) as f:
+                existing = f.read()
+        except FileNotFoundError:
+            existing = b""
+        write_atomic(filepath, existing + buf)
+        with listing_lock:
+            listing.add(filename)
+
+    send_payload(client_socket, "Append successful (backup server)".encode())
+    print(f"[+] APPEND {filename} from: {addr}")
+
+# -------- DELETE --------
+def handle_delete(client_socket, rfile, args, addr):
+    """Remove a file"""
+    [filename] = args.split()
+    if not remove_file(filename):
+        send_payload(client_socket, "ERROR: File not found".encode())
+        return
+    
+    send_payload(client_socket, "Delete successful (backup server)".encode())
+    print(f"[+] DELETE {filename} from: {addr}")
+
+def remove_file(filename):
+    """Remove a stored file, returning False if it did not exist"""
+    filepath = resolve_path(filename)
+    
+    lock = get_lock(filename)
+    with lock:
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            return False
+        with listing_lock:
+            listing.discard(filename)
+    return True
+
+# -------- UPLOAD --------
+def handle_upload(client_socket, rfile, args, addr):
+    """Receive a binary file of a known size"""
+    filename, filesize = split_sized(args)
+
+    # The file data follows the command as one frame, compressed if the
+    # client knows we accept that
+    file_data = recv_file(rfile, filesize)
+
+    filepath = resolve_path(filename)
+    lock = get_lock(filename)
+
+    with lock:
+        write_atomic(filepath, file_data)
+        with listing_lock:
+            listing.add(filename)
+
+    send_payload(client_socket, f"Upload successful (backup server): {filename} ({filesize} bytes)".encode())
+    print(f"[+] UPLOAD {filename} ({filesize} bytes) from: {addr}")
+
+# -------- DOWNLOAD --------
+def handle_download(client_socket, rfile, args, addr):
+    """Send a binary file's size followed by its contents as one frame"""
+    [filename] = args.split()
+    filepath = resolve_path(filename)
+
+    # The open file is a stable snapshot even if a writer replaces it
+    try:
+        f = open(filepath, "rb")
+    except FileNotFoundError:
+        send_payload(client_socket, "ERROR: File not found".encode())
+        return
+
+    with f:
+        filesize = os.fstat(f.fileno()).st_size
+        send_payload(client_socket, f"READY {filesize}".encode())
         
-        else:
-            client_socket.send("ERROR: Invalid command".encode())
+        # The file data follows as its own frame: compressed if the client
+        # accepts that, otherwise a zero-copy transfer from the page cache
+        send_file(client_socket, f)
+    
+    print(f"[+] DOWNLOAD {filename} ({filesize} bytes) to: {addr}")
+
+# -------- REPLICATE (from main server) --------
+def handle_replicate(client_socket, rfile, args, addr):
+    """Store a file replicated from the main server"""
+    filename, filesize = store_replica(rfile, args)
+    send_payload(client_socket, "Replication successful".encode())
+    print(f"[+] Replicated file: {filename} ({filesize} bytes)")
+
+def store_replica(rfile, args):
+    """Receive a replicated file's bytes and store them durably"""
+    filename, filesize = split_sized(args)
+    
+    # The file's bytes follow the command directly
+    file_data = recv_body(rfile, filesize)
+    
+    filepath = resolve_path(filename)
+    lock = get_lock(filename)
+    
+    with lock:
+        write_atomic(filepath, file_data)
+        with listing_lock:
+            listing.add(filename)
+    return filename, filesize
+
+# -------- REPLICATE BATCH (from main server) --------
+def handle_replicate_batch(client_socket, rfile, args, addr):
+    """Apply several replicated operations and confirm them with one reply"""
+    count = int(args)
+    results = []
+    for _ in range(count):
+        verb, _, op_args = recv_payload(rfile).decode().strip().partition(" ")
+        try:
+            if verb == "REPLICATE":
+                filename, filesize = store_replica(rfile, op_args)
+                results.append("Replication successful")
+            elif verb == "DELETE":
+                [filename] = op_args.split()
+                if remove_file(filename):
+                    results.append("Delete successful (backup server)")
+                else:
+                    results.append("ERROR: File not found")
+            else:
+                # Its body, if any, cannot be skipped, so the stream is lost
+                raise ConnectionError(f"Invalid batch operation: {verb}")
+        except (ConnectionError, socket.timeout):
+            raise  # the rest of the batch cannot be read
+        except (OSError, ValueError) as e:
+            # A failed write or delete fails only its own operation
+            results.append(f"ERROR: {str(e)}")
+    
+    # With DURABILITY = "fdatasync" every file was synced as it was
+    # written, so the batch is on disk; with "none" it may still be in
+    # the page cache
+    send_payload(client_socket, "\n".join(results).encode())
+    print(f"[+] Replicated batch of {count} operations")
+
+def handle_invalid(client_socket, rfile, args, addr):
+    """Reject an unknown command"""
+    send_payload(client_socket, "ERROR: Invalid command".encode())
+
+# Command verb -> handler, so each command is parsed once and dispatched
+# with a single dict lookup
+HANDLERS = {
+    "LIST": handle_list,
+    "READ": handle_read,
+    "WRITE": handle_write,
+    "APPEND": handle_append,
+    "DELETE": handle_delete,
+    "UPLOAD": handle_upload,
+    "DOWNLOAD": handle_download,
+    "REPLICATE": handle_replicate,
+    "REPLICATE_BATCH": handle_replicate_batch,
+}
+
+def handle_command(client_socket, rfile, command, addr):
+    """Run a single command received from a client or the main server"""
+    verb, _, args = command.partition(" ")
+    handler = HANDLERS.get(verb, handle_invalid)
+    try:
+        handler(client_socket, rfile, args, addr)
+    except ValueError as e:
+        # Malformed arguments or a filename outside STORAGE_DIR
+        send_payload(client_socket, f"ERROR: {str(e)}".encode())
+
+def serve_commands(client_socket, rfile, addr):
+    """Worker: run the commands that have arrived on a connection, then
+    hand it back to the selector loop to wait for more"""
+    try:
+        # The rest of a command that has started to arrive must follow promptly
+        client_socket.settimeout(30)
+
+        # Serve every command already received, including ones the
+        # buffered reader holds but the selector cannot see
+        while True:
+            try:
+                current.seq, command, flags = recv_frame(rfile)
+            except (ConnectionError, socket.timeout):
+                close_connection(client_socket, rfile, addr)  # peer disconnected
+                return
+            current.accepts_zstd = bool(flags & FLAG_ACCEPTS_ZSTD)
+            command = command.decode().strip()
+            handle_command(client_socket, rfile, command, addr)
+            if not command_waiting(client_socket, rfile):
+                break
     
     except Exception as e:
         print(f"[!] Error handling request from {addr}: {str(e)}")
         try:
-            client_socket.send(f"ERROR: {str(e)}".encode())
+            send_payload(client_socket, f"ERROR: {str(e)}".encode())
         except:
             pass
-    
+        close_connection(client_socket, rfile, addr)
+        return
+
+    hand_back(client_socket, rfile, addr)
+
+def command_waiting(client_socket, rfile):
+    """Return True if more of the next command is already available, without blocking"""
+    client_socket.settimeout(0)
+    try:
+        # Returns buffered bytes, or whatever one non-blocking read finds
+        return bool(rfile.peek(1))
     finally:
+        client_socket.settimeout(30)
+
+def close_connection(client_socket, rfile, addr):
+    try:
+        rfile.close()
         client_socket.close()
-        print(f"[-] Connection closed: {addr}")
+    except:
+        pass
+    print(f"[-] Connection closed: {addr}")
+
+# ---------------- CONNECTION LOOP ----------------
+# One thread waits on the listening socket and on every idle connection.
+# A connection only takes a worker while it has commands to run, so idle
+# clients and the main server's replication channel do not tie up the pool.
+selector = selectors.DefaultSelector()
+returning = queue.SimpleQueue()  # (socket, rfile, addr) handed back by workers
+wake_r, wake_w = socket.socketpair()  # lets workers interrupt select()
+wake_r.setblocking(False)
+wake_w.setblocking(False)
+
+def hand_back(client_socket, rfile, addr):
+    """Return a connection to the selector loop to wait for its next command"""
+    returning.put((client_socket, rfile, addr))
+    try:
+        wake_w.send(b"\0")
+    except BlockingIOError:
+        pass  # a wakeup is already pending
+
+def accept_connections():
+    """Accept every pending connection"""
+    while True:
+        try:
+            client_socket, addr = backup_server.accept()
+        except BlockingIOError:
+            return
+        tune_socket(client_socket)
+        print(f"[+] Connection from: {addr}")
+        # All reads go through one buffered reader, so a message split across
+        # several TCP segments is reassembled before it is parsed
+        rfile = client_socket.makefile("rb", buffering=CHUNK_SIZE)
+        selector.register(client_socket, selectors.EVENT_READ, (rfile, addr, time.time()))
+
+def register_returning():
+    """Start watching connections the workers have finished with"""
+    try:
+        while True:
+            wake_r.recv(4096)
+    except BlockingIOError:
+        pass
+    while not returning.empty():
+        client_socket, rfile, addr = returning.get()
+        selector.register(client_socket, selectors.EVENT_READ, (rfile, addr, time.time()))
+
+def close_idle():
+    """Close connections that have sent nothing for IDLE_TIMEOUT seconds"""
+    deadline = time.time() - IDLE_TIMEOUT
+    for key in list(selector.get_map().values()):
+        if key.data is not None and key.data[2] < deadline:
+            rfile, addr, _ = key.data
+            selector.unregister(key.fileobj)
+            close_connection(key.fileobj, rfile, addr)
 
 # ---------------- SERVER SETUP ----------------
 backup_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 backup_server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+tune_socket(backup_server)  # buffer sizes must be set before listen() to be inherited
 backup_server.bind((BACKUP_SERVER_IP, BACKUP_PORT))
-backup_server.listen(5)
+backup_server.listen(1024)
+backup_server.setblocking(False)  # accepted in batches by the selector loop
 
 print("=" * 50)
 print("BACKUP SERVER RUNNING")
@@ -238,19 +597,34 @@ print("  • Serves clients when Main Server is down")
 print("  • Supports all file operations")
 print("=" * 50)
 
+# Bounded pool of worker threads instead of one thread per connection
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+selector.register(backup_server, selectors.EVENT_READ)
+selector.register(wake_r, selectors.EVENT_READ)
+last_sweep = time.time()
+
 while True:
     try:
-        client_socket, addr = backup_server.accept()
-        request_thread = threading.Thread(
-            target=handle_request,
-            args=(client_socket, addr)
-        )
-        request_thread.daemon = True
-        request_thread.start()
+        for key, _ in selector.select(timeout=1):
+            if key.fileobj is backup_server:
+                accept_connections()
+            elif key.fileobj is wake_r:
+                register_returning()
+            else:
+                # A command is arriving; a worker serves it and hands the connection back
+                rfile, addr, _ = key.data
+                selector.unregister(key.fileobj)
+                executor.submit(serve_commands, key.fileobj, rfile, addr)
+        # Scanning every connection is O(n), so only do it now and then
+        if time.time() - last_sweep >= IDLE_SWEEP_INTERVAL:
+            close_idle()
+            last_sweep = time.time()
     except KeyboardInterrupt:
         print("\n[!] Backup server shutting down...")
         break
     except Exception as e:
         print(f"[!] Server error: {str(e)}")
 
+executor.shutdown(wait=False, cancel_futures=True)
 backup_server.close()
\ No newline at end of file
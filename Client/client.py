@@ -2,256 +2,429 @@ import socket
 import time
 import os
 import json
+import pickle
+import queue
+import struct
+import sys
+import threading
+import atexit
+
+try:
+    import zstandard  # optional: compresses large payloads on the wire
+except ImportError:
+    zstandard = None
 
 SERVER_IP = "127.0.0.1"
 PORT = 9000
 BACKUP_SERVER_IP = "127.0.0.1"
 BACKUP_PORT = 9001
 CACHE_DIR = "cache"
-CACHE_FILE = os.path.join(CACHE_DIR, "file_cache.json")
+CACHE_FILE = os.path.join(CACHE_DIR, "file_cache.pickle")
+LEGACY_CACHE_FILE = os.path.join(CACHE_DIR, "file_cache.json")  # read once to migrate old caches
+CACHE_FLUSH_INTERVAL = 5  # seconds between background cache flushes
+CHUNK_SIZE = 64 * 1024  # bytes per socket send/recv
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # SO_RCVBUF/SO_SNDBUF for data sockets
+FRAME_HEADER = struct.Struct("!IQB")  # sequence number, length and flags before every message and payload
+FLAG_ZSTD = 1  # the frame's payload is zstd-compressed
+FLAG_ACCEPTS_ZSTD = 2  # the sender can decode zstd-compressed payloads
+COMPRESS_MIN_SIZE = 16 * 1024  # smaller payloads are sent as they are
+COMPRESS_LEVEL = 3  # zstd level: fast, and still shrinks text several times
+MAX_FRAME_SIZE = 1024 * 1024 * 1024  # largest decompressed payload accepted
+PIPELINE = not sys.stdin.isatty()  # scripted input sends commands without waiting for replies
+REPLY_TIMEOUT = 30  # seconds to wait for an outstanding reply
+MAIN_RETRY_INTERVAL = 5  # seconds between attempts to return to the main server after a failover
+FRAME_FLAGS = FLAG_ACCEPTS_ZSTD if zstandard else 0  # set on every frame sent
 
 # Create cache directory
 os.makedirs(CACHE_DIR, exist_ok=True)
 
 # ---------------- CACHE MANAGEMENT ----------------
 def load_cache():
-    """Load cache from disk"""
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, "r") as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    """Load cache from disk, falling back to a JSON cache left by older versions"""
+    try:
+        with open(CACHE_FILE, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except:
+        return {}
+    try:
+        with open(LEGACY_CACHE_FILE, "r") as f:
+            cache = json.load(f)
+    except:
+        return {}
+    # Move the old cache over to the new format
+    save_cache(cache)
+    os.remove(LEGACY_CACHE_FILE)
+    return cache
 
 def save_cache(cache):
-    """Save cache to disk"""
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f, indent=2)
+    """Save cache to disk, replacing the old file atomically"""
+    tmp = CACHE_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(cache, f, protocol=5)
+    os.replace(tmp, CACHE_FILE)
+
+# The cache lives in memory for the whole session and is only written
+# back to disk when it has changed
+CACHE = load_cache()
+_dirty = False
+
+def flush_cache():
+    """Write the in-memory cache to disk if it changed"""
+    global _dirty
+    if not _dirty:
+        return
+    _dirty = False
+    save_cache(dict(CACHE))
+
+def _flush_periodically():
+    """Flush the cache every CACHE_FLUSH_INTERVAL seconds"""
+    flush_cache()
+    timer = threading.Timer(CACHE_FLUSH_INTERVAL, _flush_periodically)
+    timer.daemon = True
+    timer.start()
 
 def get_from_cache(filename):
     """Get file content from cache"""
-    cache = load_cache()
-    if filename in cache:
+    if filename in CACHE:
         print(f"[CACHE HIT] Retrieved {filename} from cache")
-        return cache[filename]["content"]
+        return CACHE[filename]["content"]
     return None
 
 def add_to_cache(filename, content):
     """Add file content to cache"""
-    cache = load_cache()
-    cache[filename] = {
+    global _dirty
+    CACHE[filename] = {
         "content": content,
         "timestamp": time.time()
     }
-    save_cache(cache)
+    _dirty = True
     print(f"[CACHE] Added {filename} to cache")
 
 def invalidate_cache(filename):
     """Remove file from cache"""
-    cache = load_cache()
-    if filename in cache:
-        del cache[filename]
-        save_cache(cache)
+    global _dirty
+    if CACHE.pop(filename, None) is not None:
+        _dirty = True
         print(f"[CACHE] Invalidated {filename}")
 
+_flush_periodically()
+atexit.register(flush_cache)
+
 # ---------------- NETWORK OPERATIONS ----------------
-def send_command(command, data=None, use_backup=False):
-    """Send command to server with automatic failover"""
-    server_ip = BACKUP_SERVER_IP if use_backup else SERVER_IP
-    port = BACKUP_PORT if use_backup else PORT
-    max_retries = 3
-    retry_delay = 2
-    
-    for attempt in range(max_retries):
+def tune_socket(sock):
+    """Enlarge kernel socket buffers and disable Nagle's algorithm"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if hasattr(socket, "TCP_QUICKACK"):
+        # Linux only: acknowledge small commands and replies straight away
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+def recv_exact(rfile, size):
+    """Read exactly size bytes from a buffered socket reader"""
+    # readinto() keeps reading until the buffer is full, so short reads
+    # from the socket never leak out as partial messages
+    buf = bytearray(size)
+    if rfile.readinto(buf) != size:
+        raise ConnectionError("Connection closed before all data was received")
+    return buf
+
+def encode_payload(data, peer_accepts_zstd):
+    """Return the bytes to send for data and the frame flags describing them"""
+    if zstandard and peer_accepts_zstd and len(data) >= COMPRESS_MIN_SIZE:
+        packed = zstandard.ZstdCompressor(level=COMPRESS_LEVEL).compress(data)
+        if len(packed) < len(data):
+            return packed, FRAME_FLAGS | FLAG_ZSTD
+    return data, FRAME_FLAGS
+
+def decode_payload(payload, flags):
+    """Undo the compression described by a frame's flags"""
+    if not flags & FLAG_ZSTD:
+        return payload
+    if zstandard is None:
+        raise ValueError("Received a compressed payload but zstandard is not installed")
+    # Our compressed frames always record their size; check it before allocating
+    size = zstandard.frame_content_size(payload)
+    if not 0 <= size <= MAX_FRAME_SIZE:
+        raise ValueError("Compressed payload has a missing or oversized content size")
+    try:
+        return zstandard.ZstdDecompressor().decompress(payload)
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Invalid compressed payload: {str(e)}")
+
+def recv_frame(rfile):
+    """Receive a frame and return its sequence number, payload (still
+    compressed, if it was sent that way) and flags"""
+    seq, size, flags = FRAME_HEADER.unpack(recv_exact(rfile, FRAME_HEADER.size))
+    return seq, recv_exact(rfile, size), flags
+
+def send_payload(sock, seq, *payloads, compress=False):
+    """Send one or more payloads, each prefixed with the sequence number and
+    its length, in a single sendall so they can share a TCP segment"""
+    parts = []
+    for data in payloads:
+        data, flags = encode_payload(data, compress)
+        parts.append(FRAME_HEADER.pack(seq, len(data), flags))
+        parts.append(data)
+    sock.sendall(b"".join(parts))
+
+def send_file(sock, seq, f, size, compress=False):
+    """Send the first size bytes of an open file as one frame"""
+    if zstandard and compress and size >= COMPRESS_MIN_SIZE:
+        # Compression needs the contents in memory, so skip the zero-copy send
+        f.seek(0)
+        send_payload(sock, seq, f.read(size), compress=True)
+        return
+    sock.sendall(FRAME_HEADER.pack(seq, size, FRAME_FLAGS))
+    sock.sendfile(f, 0, size)
+
+# One connection is kept open and reused for every command. Commands are
+# sent without waiting for earlier replies: every frame carries a sequence
+# number that the server echoes, and a reader thread matches each reply
+# to its command and queues the result for printing.
+_conn = None
+_conn_zstd = False  # the server on _conn has said it accepts compressed payloads
+_on_backup = False  # _conn goes to the backup server
+_main_retry_at = 0  # when to next try the main server while on the backup
+_seq = 0
+_pending = {}  # seq -> (connection, command, save_path)
+_pending_lock = threading.Lock()
+replies = queue.Queue()  # results in the order they arrived
+
+def connect(server_ip, port):
+    """Open a connection and start the thread that reads its replies"""
+    global _conn_zstd
+    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tune_socket(client)
+    client.settimeout(10)
+    client.connect((server_ip, port))
+    # The reader thread blocks until the next reply arrives; a timeout
+    # would leave its buffered reader in an undefined state
+    client.settimeout(None)
+    _conn_zstd = False  # until the server's first reply says otherwise
+    rfile = client.makefile("rb", buffering=CHUNK_SIZE)
+    threading.Thread(target=read_replies, args=(client, rfile), daemon=True).start()
+    return client
+
+def get_conn():
+    """Return the open connection, connecting with automatic failover if needed"""
+    global _conn, _on_backup, _main_retry_at
+    if _conn is not None and _on_backup and time.time() >= _main_retry_at:
+        # Go back to the main server as soon as it is reachable again, so
+        # writes stop landing only on the backup
         try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(10)
-            client.connect((server_ip, port))
-
-            client.send(command.encode())
-
-            if command.startswith("WRITE") or command.startswith("APPEND"):
-                response = client.recv(1024).decode()
-                if response == "READY":
-                    client.send(data.encode())
-                    client.send("<<EOF>>".encode())
-
-            result = client.recv(4096).decode()
-            client.close()
-            
-            # Cache READ results
-            if command.startswith("READ") and not result.startswith("ERROR"):
-                filename = command.split()[1]
-                add_to_cache(filename, result)
-            
-            # Invalidate cache on WRITE/UPLOAD/APPEND/DELETE
-            if command.startswith(("WRITE", "UPLOAD", "APPEND", "DELETE")):
-                filename = command.split()[1]
-                invalidate_cache(filename)
-            
-            return result
+            conn = connect(SERVER_IP, PORT)
+        except OSError:
+            _main_retry_at = time.time() + MAIN_RETRY_INTERVAL
+        else:
+            print("[+] Main server is back; leaving the backup server")
+            try:
+                # The backup still answers what was already sent to it,
+                # then closes, which ends that connection's reader thread
+                _conn.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            _conn = conn
+            _on_backup = False
+    if _conn is None:
+        max_retries = 3
+        retry_delay = 2
+        for attempt in range(max_retries):
+            try:
+                _conn = connect(SERVER_IP, PORT)
+                _on_backup = False
+                return _conn
+            except OSError as e:
+                print(f"[!] Connection attempt {attempt + 1} failed: {str(e)}")
+                if attempt < max_retries - 1:
+                    time.sleep(retry_delay)
+        print("[!] Trying backup server...")
+        _conn = connect(BACKUP_SERVER_IP, BACKUP_PORT)
+        _on_backup = True
+        _main_retry_at = time.time() + MAIN_RETRY_INTERVAL
+    return _conn
+
+def close_conn():
+    """Drop the shared connection so the next command reconnects"""
+    global _conn
+    if _conn is not None:
+        try:
+            # Wakes the reader thread, which closes the socket and fails
+            # whatever is still pending on it
+            _conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    _conn = None
+
+def fallback(command, error):
+    """Result for a command the server never answered"""
+    # Try cache for READ only
+    parts = command.split()
+    if len(parts) > 1 and parts[0] == "READ":
+        cached_content = get_from_cache(parts[1])
+        if cached_content:
+            return f"[FROM CACHE]\n{cached_content}"
+    return error
+
+def format_listing(result):
+    """Turn a JSON LIST reply into one file name per line"""
+    files = json.loads(result)
+    return "\n".join(files) if files else "No files on server"
+
+def handle_reply(rfile, command, save_path, result):
+    """Apply a reply to the local cache or disk and return the text to show"""
+    # READ of a binary file is not valid UTF-8; show it rather than fail
+    result = result.decode(errors="replace")
+    
+    if command.startswith("DOWNLOAD") and result.startswith("READY"):
+        _, filesize = result.split()
+        filesize = int(filesize)
+        filename = command.split()[1]
         
-        except (socket.timeout, ConnectionRefusedError, OSError) as e:
-            print(f"[!] Connection attempt {attempt + 1} failed: {str(e)}")
-            
-            # Last attempt: try failover for READ, LIST, WRITE, APPEND, DELETE
-            if attempt == max_retries - 1:
-                # Try backup server for these operations
-                if (command.startswith("READ") or 
-                    command.startswith("WRITE") or 
-                    command.startswith("APPEND") or 
-                    command.startswith("DELETE") or 
-                    command == "LIST") and not use_backup:
-                    print("[!] Trying backup server...")
-                    return send_command(command, data, use_backup=True)
-                
-                # Try cache for READ only
-                if command.startswith("READ"):
-                    filename = command.split()[1]
-                    cached_content = get_from_cache(filename)
-                    if cached_content:
-                        return f"[FROM CACHE]\n{cached_content}"
-            
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
+        # Receive file data, which follows the header as its own frame
+        _, payload, flags = recv_frame(rfile)
+        file_data = decode_payload(payload, flags)
+        if len(file_data) != filesize:
+            raise ValueError(f"Expected {filesize} bytes but received {len(file_data)}")
         
-        except Exception as e:
-            print(f"[!] Error: {str(e)}")
+        # Save to local file
+        try:
+            with open(save_path, "wb") as f:
+                f.write(file_data)
+        except OSError as e:
             return f"ERROR: {str(e)}"
         
-        finally:
-            try:
-                client.close()
-            except:
-                pass
+        return f"Download successful: {filename} ({filesize} bytes) saved to {save_path}"
     
-    return "ERROR: Could not connect to server after multiple attempts"
-
-def upload_file(filepath, use_backup=False):
-    """Upload a file to the server"""
-    if not os.path.exists(filepath):
-        return "ERROR: File not found on local system"
+    if command == "LIST" and not result.startswith("ERROR"):
+        return format_listing(result)
     
-    filename = os.path.basename(filepath)
-    filesize = os.path.getsize(filepath)
+    # Cache READ results
+    if command.startswith("READ") and not result.startswith("ERROR"):
+        add_to_cache(command.split()[1], result)
     
-    server_ip = BACKUP_SERVER_IP if use_backup else SERVER_IP
-    port = BACKUP_PORT if use_backup else PORT
+    # Invalidate cache on WRITE/UPLOAD/APPEND/DELETE
+    if command.startswith(("WRITE", "UPLOAD", "APPEND", "DELETE")):
+        invalidate_cache(command.split()[1])
     
+    return result
+
+def read_replies(client, rfile):
+    """Reader thread: queue the result of every reply that arrives on client"""
+    global _conn, _conn_zstd
+    try:
+        while True:
+            seq, payload, flags = recv_frame(rfile)
+            if _conn is client:
+                _conn_zstd = bool(flags & FLAG_ACCEPTS_ZSTD)
+            with _pending_lock:
+                entry = _pending.get(seq)
+            if entry is None:
+                # Not an answer to a command, e.g. the server's notice
+                # before it closes an idle connection
+                replies.put(payload.decode(errors="replace"))
+                continue
+            _, command, save_path = entry
+            try:
+                result = handle_reply(rfile, command, save_path, decode_payload(payload, flags))
+            except ValueError as e:
+                # A bad reply fails its own command, not the connection
+                result = f"ERROR: {str(e)}"
+            replies.put(result)
+            # Drop the entry only once its result is queued, so an empty
+            # _pending means every result is already in the queue
+            with _pending_lock:
+                del _pending[seq]
+    except OSError:
+        pass  # server closed the connection or close_conn() shut it down
+    finally:
+        if _conn is client:
+            _conn = None
+        with _pending_lock:
+            lost = [(seq, command) for seq, (conn, command, _) in _pending.items() if conn is client]
+        for seq, command in lost:
+            replies.put(fallback(command, "ERROR: Connection lost before the server replied"))
+            with _pending_lock:
+                del _pending[seq]
+        rfile.close()
+        client.close()
+
+def submit(command, data=None, upload=None, upload_size=0, save_path=None):
+    """Send a command and its payload without waiting for the reply"""
+    global _seq
     max_retries = 3
+    
     for attempt in range(max_retries):
         try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(30)
-            client.connect((server_ip, port))
-            
-            # Send upload command
-            client.send(f"UPLOAD {filename} {filesize}".encode())
-            response = client.recv(1024).decode()
-            
-            if response == "READY":
-                # Send file data
-                with open(filepath, "rb") as f:
-                    sent = 0
-                    while sent < filesize:
-                        chunk = f.read(4096)
-                        client.send(chunk)
-                        sent += len(chunk)
-                
-                result = client.recv(1024).decode()
-                client.close()
-                invalidate_cache(filename)
-                return result
+            client = get_conn()
+        except OSError:
+            replies.put(fallback(command, "ERROR: Could not connect to server after multiple attempts"))
+            return
+        
+        _seq = (_seq + 1) % 2**32
+        seq = _seq
+        with _pending_lock:
+            _pending[seq] = (client, command, save_path)
+        
+        try:
+            if data is not None:
+                # The text follows the command directly, in the same send
+                send_payload(client, seq, command.encode(), data.encode(), compress=_conn_zstd)
             else:
-                client.close()
-                return f"ERROR: {response}"
+                send_payload(client, seq, command.encode())
+            if upload is not None:
+                # The file data follows the command as one frame
+                send_file(client, seq, upload, upload_size, compress=_conn_zstd)
+            return
         
-        except Exception as e:
-            print(f"[!] Upload attempt {attempt + 1} failed: {str(e)}")
-            
-            # Try backup server on last attempt
-            if attempt == max_retries - 1 and not use_backup:
-                print("[!] Trying backup server...")
-                return upload_file(filepath, use_backup=True)
-            
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        finally:
-            try:
-                client.close()
-            except:
-                pass
+        except OSError as e:
+            with _pending_lock:
+                _pending.pop(seq, None)
+            close_conn()
+            print(f"[!] Send attempt {attempt + 1} failed: {str(e)}")
     
-    return "ERROR: Could not upload file after multiple attempts"
+    replies.put(f"ERROR: Could not send {command.split()[0]} after multiple attempts")
 
-def download_file(filename, save_path=None, use_backup=False):
-    """Download a file from the server"""
-    if save_path is None:
-        save_path = filename
-    
-    server_ip = BACKUP_SERVER_IP if use_backup else SERVER_IP
-    port = BACKUP_PORT if use_backup else PORT
-    
-    max_retries = 3
-    for attempt in range(max_retries):
+def print_replies(wait=False):
+    """Print the results that have arrived; with wait, first let every
+    outstanding command finish"""
+    while True:
         try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(30)
-            client.connect((server_ip, port))
-            
-            client.send(f"DOWNLOAD {filename}".encode())
-            response = client.recv(1024).decode()
-            
-            if response.startswith("READY"):
-                _, filesize = response.split()
-                filesize = int(filesize)
-                
-                client.send("ACK".encode())
-                
-                # Receive file data
-                received = 0
-                file_data = b""
-                while received < filesize:
-                    chunk = client.recv(min(4096, filesize - received))
-                    if not chunk:
-                        break
-                    file_data += chunk
-                    received += len(chunk)
-                
-                # Save to local file
-                with open(save_path, "wb") as f:
-                    f.write(file_data)
-                
-                client.close()
-                return f"Download successful: {filename} ({filesize} bytes) saved to {save_path}"
-            else:
-                client.close()
-                return response
-        
-        except Exception as e:
-            print(f"[!] Download attempt {attempt + 1} failed: {str(e)}")
-            
-            # Try backup server on last attempt
-            if attempt == max_retries - 1 and not use_backup:
-                print("[!] Trying backup server...")
-                return download_file(filename, save_path, use_backup=True)
-            
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        finally:
+            result = replies.get(block=False)
+        except queue.Empty:
+            if not (wait and _pending):
+                return
             try:
-                client.close()
-            except:
-                pass
+                result = replies.get(timeout=REPLY_TIMEOUT)
+            except queue.Empty:
+                print("[!] Timed out waiting for the server")
+                close_conn()  # the reader thread fails what is still pending
+                continue
+        print(result)
+
+def upload_file(filepath):
+    """Upload a file to the server"""
+    filename = os.path.basename(filepath)
+    try:
+        f = open(filepath, "rb")
+    except OSError:
+        replies.put("ERROR: File not found on local system")
+        return
     
-    return "ERROR: Could not download file after multiple attempts"
+    with f:
+        filesize = os.fstat(f.fileno()).st_size
+        submit(f"UPLOAD {filename} {filesize}", upload=f, upload_size=filesize)
 
 # ---------------- CLIENT INTERFACE ----------------
 print("== Distributed File System Client ==")
 print("Features: Caching, Automatic Failover, Replication, File Transfer\n")
 
 while True:
+    # Show results that arrived meanwhile; interactive use waits for them
+    print_replies(wait=not PIPELINE)
+    
     print("\nCommands:")
     print("  LIST                    - List files on server")
     print("  READ <file>             - Read file content")
@@ -266,13 +439,15 @@ while True:
     cmd = input("\n>> ").strip()
 
     if cmd == "EXIT":
+        print_replies(wait=True)
+        close_conn()
         break
     
     elif cmd == "CACHE":
-        cache = load_cache()
-        if cache:
+        print_replies(wait=True)  # let outstanding READs reach the cache first
+        if CACHE:
             print("\n--- Cached Files ---")
-            for filename, info in cache.items():
+            for filename, info in list(CACHE.items()):
                 timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['timestamp']))
                 print(f"  {filename} (cached at {timestamp})")
         else:
@@ -282,7 +457,7 @@ while True:
         try:
             _, filename = cmd.split()
             content = input("Enter file content:\n")
-            print(send_command(cmd, content))
+            submit(cmd, content)
         except ValueError:
             print("Usage: WRITE <filename>")
     
@@ -290,7 +465,7 @@ while True:
         try:
             _, filename = cmd.split()
             content = input("Enter content to append:\n")
-            print(send_command(cmd, content))
+            submit(cmd, content)
         except ValueError:
             print("Usage: APPEND <filename>")
     
@@ -299,7 +474,7 @@ while True:
             _, filename = cmd.split()
             confirm = input(f"Are you sure you want to delete '{filename}'? (yes/no): ")
             if confirm.lower() == "yes":
-                print(send_command(cmd))
+                submit(cmd)
             else:
                 print("Delete cancelled")
         except ValueError:
@@ -312,7 +487,7 @@ while True:
                 print("Usage: UPLOAD <local_file_path>")
             else:
                 filepath = parts[1].strip('"')
-                print(upload_file(filepath))
+                upload_file(filepath)
         except Exception as e:
             print(f"ERROR: {str(e)}")
     
@@ -324,9 +499,9 @@ while True:
             else:
                 filename = parts[1]
                 save_path = parts[2] if len(parts) > 2 else filename
-                print(download_file(filename, save_path))
+                submit(f"DOWNLOAD {filename}", save_path=save_path)
         except Exception as e:
             print(f"ERROR: {str(e)}")
 
     else:
-        print(send_command(cmd))
+        submit(cmd)
@@ -2,6 +2,17 @@ import socket
 import time
 import os
 import json
+import pickle
+import select
+import struct
+import threading
+import atexit
+from collections import OrderedDict
+
+try:
+    import zstandard  # optional: compresses large payloads on the wire
+except ImportError:
+    zstandard = None
 
 # ============ REMOTE CLIENT CONFIGURATION ============
 SERVER_IP = "172.20.10.2"
@@ -10,54 +21,253 @@ BACKUP_SERVER_IP = "172.20.10.2"
 BACKUP_PORT = 9001
 
 CACHE_DIR = "cache"
-CACHE_FILE = os.path.join(CACHE_DIR, "file_cache.json")
+CACHE_FILE = os.path.join(CACHE_DIR, "file_cache.pickle")
+LEGACY_CACHE_FILE = os.path.join(CACHE_DIR, "file_cache.json")  # read once to migrate old caches
+CACHE_MAX_ITEMS = 256  # files kept in the cache before the oldest is evicted
+CACHE_TTL = 24 * 60 * 60  # seconds a cached file stays usable
+CACHE_SAVE_DELAY = 1  # seconds of inactivity before the cache is saved
+CHUNK_SIZE = 64 * 1024  # bytes per socket recv
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # SO_RCVBUF/SO_SNDBUF for data sockets
+FRAME_HEADER = struct.Struct("!IQB")  # sequence number, length and flags before every message and payload
+FLAG_ZSTD = 1  # the frame's payload is zstd-compressed
+FLAG_ACCEPTS_ZSTD = 2  # the sender can decode zstd-compressed payloads
+COMPRESS_MIN_SIZE = 16 * 1024  # smaller payloads are sent as they are
+COMPRESS_LEVEL = 3  # zstd level: fast, and still shrinks text several times
+MAX_FRAME_SIZE = 1024 * 1024 * 1024  # largest decompressed payload accepted
+FRAME_FLAGS = FLAG_ACCEPTS_ZSTD if zstandard else 0  # set on every frame sent
 
 # cache directory
 os.makedirs(CACHE_DIR, exist_ok=True)
 
 # ---------------- CACHE MANAGEMENT ----------------
 def load_cache():
-    """Load cache from disk"""
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, "r") as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    """Load cache from disk, falling back to a JSON cache left by older versions"""
+    try:
+        with open(CACHE_FILE, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except:
+        return {}
+    try:
+        with open(LEGACY_CACHE_FILE, "r") as f:
+            cache = json.load(f)
+    except:
+        return {}
+    # Move the old cache over to the new format
+    save_cache(cache)
+    os.remove(LEGACY_CACHE_FILE)
+    return cache
 
 def save_cache(cache):
-    """Save cache to disk"""
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f, indent=2)
+    """Save cache to disk, replacing the old file atomically"""
+    tmp = CACHE_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(cache, f, protocol=5)
+    os.replace(tmp, CACHE_FILE)
+
+class Cache:
+    """Bounded LRU cache of file contents whose entries expire after a TTL"""
+
+    def __init__(self, entries, max_items, ttl):
+        # filename -> {"content", "timestamp"}, least recently used first
+        self.entries = OrderedDict(entries)
+        self.max_items = max_items
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+    def get(self, filename):
+        """Return the cached content, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(filename)
+            if entry is None:
+                return None
+            if time.time() - entry["timestamp"] > self.ttl:
+                del self.entries[filename]
+                return None
+            self.entries.move_to_end(filename)
+            return entry["content"]
+
+    def set(self, filename, content):
+        """Store content, evicting the least recently used entries"""
+        with self.lock:
+            self.entries[filename] = {
+                "content": content,
+                "timestamp": time.time()
+            }
+            self.entries.move_to_end(filename)
+            while len(self.entries) > self.max_items:
+                self.entries.popitem(last=False)
+
+    def delete(self, filename):
+        """Remove an entry; return True if there was one"""
+        with self.lock:
+            return self.entries.pop(filename, None) is not None
+
+    def snapshot(self):
+        """Return a plain copy of the entries"""
+        with self.lock:
+            return dict(self.entries)
+
+# The cache is read from disk once and kept in memory; changes are
+# written back after CACHE_SAVE_DELAY seconds without further changes
+CACHE = Cache(load_cache(), CACHE_MAX_ITEMS, CACHE_TTL)
+_dirty = False
+_save_timer = None
+
+def flush_cache():
+    """Write the in-memory cache to disk if it changed"""
+    global _dirty
+    if not _dirty:
+        return
+    _dirty = False
+    save_cache(CACHE.snapshot())
+
+def schedule_save():
+    """Mark the cache changed and (re)start the debounced save"""
+    global _dirty, _save_timer
+    _dirty = True
+    if _save_timer is not None:
+        _save_timer.cancel()
+    _save_timer = threading.Timer(CACHE_SAVE_DELAY, flush_cache)
+    _save_timer.daemon = True
+    _save_timer.start()
 
 def get_from_cache(filename):
     """Get file content from cache"""
-    cache = load_cache()
-    if filename in cache:
+    content = CACHE.get(filename)
+    if content is not None:
         print(f"[CACHE HIT] Retrieved {filename} from cache")
-        return cache[filename]["content"]
-    return None
+    return content
 
 def add_to_cache(filename, content):
     """Add file content to cache"""
-    cache = load_cache()
-    cache[filename] = {
-        "content": content,
-        "timestamp": time.time()
-    }
-    save_cache(cache)
+    CACHE.set(filename, content)
+    schedule_save()
     print(f"[CACHE] Added {filename} to cache")
 
 def invalidate_cache(filename):
     """Remove file from cache"""
-    cache = load_cache()
-    if filename in cache:
-        del cache[filename]
-        save_cache(cache)
+    if CACHE.delete(filename):
+        schedule_save()
         print(f"[CACHE] Invalidated {filename}")
 
+atexit.register(flush_cache)
+
 # ---------------- NETWORK OPERATIONS ----------------
+def tune_socket(sock):
+    """Enlarge kernel socket buffers and disable Nagle's algorithm"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if hasattr(socket, "TCP_QUICKACK"):
+        # Linux only: acknowledge small commands and replies straight away
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+def recv_exact(sock, size):
+    """Receive exactly size bytes into a preallocated buffer"""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], min(CHUNK_SIZE, size - received))
+        if not n:
+            raise ConnectionError("Connection closed before all data was received")
+        received += n
+    return buf
+
+def encode_payload(data, peer_accepts_zstd):
+    """Return the bytes to send for data and the frame flags describing them"""
+    if zstandard and peer_accepts_zstd and len(data) >= COMPRESS_MIN_SIZE:
+        packed = zstandard.ZstdCompressor(level=COMPRESS_LEVEL).compress(data)
+        if len(packed) < len(data):
+            return packed, FRAME_FLAGS | FLAG_ZSTD
+    return data, FRAME_FLAGS
+
+def decode_payload(payload, flags):
+    """Undo the compression described by a frame's flags"""
+    if not flags & FLAG_ZSTD:
+        return payload
+    if zstandard is None:
+        raise ValueError("Received a compressed payload but zstandard is not installed")
+    # Our compressed frames always record their size; check it before allocating
+    size = zstandard.frame_content_size(payload)
+    if not 0 <= size <= MAX_FRAME_SIZE:
+        raise ValueError("Compressed payload has a missing or oversized content size")
+    try:
+        return zstandard.ZstdDecompressor().decompress(payload)
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Invalid compressed payload: {str(e)}")
+
+def recv_frame(sock):
+    """Receive a frame and return its payload and flags"""
+    _, size, flags = FRAME_HEADER.unpack(recv_exact(sock, FRAME_HEADER.size))
+    return decode_payload(recv_exact(sock, size), flags), flags
+
+def recv_payload(sock):
+    """Receive a frame and return only its payload"""
+    return recv_frame(sock)[0]
+
+def send_payload(sock, *payloads, compress=False):
+    """Send one or more payloads, each prefixed with a sequence number and
+    its length, in a single sendall so they can share a TCP segment"""
+    # One command at a time, so every frame can use sequence number 0
+    parts = []
+    for data in payloads:
+        data, flags = encode_payload(data, compress)
+        parts.append(FRAME_HEADER.pack(0, len(data), flags))
+        parts.append(data)
+    sock.sendall(b"".join(parts))
+
+class ConnectionPool:
+    """One persistent connection per server, reused across commands"""
+
+    def __init__(self):
+        self.conns = {}  # (ip, port) -> socket
+        self.zstd = set()  # (ip, port) of connections whose server accepts compressed payloads
+
+    def get(self, server_ip, port, timeout):
+        """Return the open connection to server_ip:port, connecting if needed"""
+        key = (server_ip, port)
+        client = self.conns.get(key)
+        if client is not None:
+            # An idle connection only becomes readable when the server closed it
+            readable, _, _ = select.select([client], [], [], 0)
+            if readable:
+                self.discard(server_ip, port)
+                client = None
+        if client is None:
+            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            tune_socket(client)
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            client.settimeout(timeout)
+            client.connect(key)
+            self.conns[key] = client
+        client.settimeout(timeout)
+        return client
+
+    def discard(self, server_ip, port):
+        """Close and forget the connection to server_ip:port"""
+        self.zstd.discard((server_ip, port))
+        client = self.conns.pop((server_ip, port), None)
+        if client is not None:
+            try:
+                client.close()
+            except:
+                pass
+
+    def close_all(self):
+        """Close every pooled connection"""
+        for server_ip, port in list(self.conns):
+            self.discard(server_ip, port)
+
+pool = ConnectionPool()
+
+def format_listing(result):
+    """Turn a JSON LIST reply into one file name per line"""
+    files = json.loads(result)
+    return "\n".join(files) if files else "No files on server"
+
 def send_command(command, data=None, use_backup=False):
     """Send command to server with automatic failover"""
     server_ip = BACKUP_SERVER_IP if use_backup else SERVER_IP
@@ -67,20 +277,22 @@ def send_command(command, data=None, use_backup=False):
     
     for attempt in range(max_retries):
         try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(10)
-            client.connect((server_ip, port))
-
-            client.send(command.encode())
-
-            if command.startswith("WRITE") or command.startswith("APPEND"):
-                response = client.recv(1024).decode()
-                if response == "READY":
-                    client.send(data.encode())
-                    client.send("<<EOF>>".encode())
+            client = pool.get(server_ip, port, 10)
 
-            result = client.recv(4096).decode()
-            client.close()
+            if command.startswith(("WRITE", "APPEND")):
+                # The text follows the command directly, in the same send
+                compress = (server_ip, port) in pool.zstd
+                send_payload(client, command.encode(), data.encode(), compress=compress)
+            else:
+                send_payload(client, command.encode())
+            result, flags = recv_frame(client)
+            # READ of a binary file is not valid UTF-8; show it rather than fail
+            result = result.decode(errors="replace")
+            if flags & FLAG_ACCEPTS_ZSTD:
+                pool.zstd.add((server_ip, port))
+            
+            if command == "LIST" and not result.startswith("ERROR"):
+                return format_listing(result)
             
             # Cache READ results
             if command.startswith("READ") and not result.startswith("ERROR"):
@@ -95,6 +307,7 @@ def send_command(command, data=None, use_backup=False):
             return result
         
         except (socket.timeout, ConnectionRefusedError, OSError) as e:
+            pool.discard(server_ip, port)
             print(f"[!] Connection attempt {attempt + 1} failed: {str(e)}")
             
             if not use_backup and command.startswith("READ") and attempt == max_retries - 1:
@@ -111,62 +324,60 @@ def send_command(command, data=None, use_backup=False):
                 time.sleep(retry_delay)
         
         except Exception as e:
+            pool.discard(server_ip, port)
             print(f"[!] Error: {str(e)}")
             return f"ERROR: {str(e)}"
-        
-        finally:
-            try:
-                client.close()
-            except:
-                pass
     
     return "ERROR: Could not connect to server after multiple attempts"
 
 def upload_file(filepath):
     """Upload a file to the server"""
-    if not os.path.exists(filepath):
+    try:
+        f = open(filepath, "rb")
+    except OSError:
         return "ERROR: File not found on local system"
     
     filename = os.path.basename(filepath)
-    filesize = os.path.getsize(filepath)
     
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(30)
-            client.connect((SERVER_IP, PORT))
-            
-            # Send upload command
-            client.send(f"UPLOAD {filename} {filesize}".encode())
-            response = client.recv(1024).decode()
-            
-            if response == "READY":
-                # Send file data
-                with open(filepath, "rb") as f:
+    with f:
+        filesize = os.fstat(f.fileno()).st_size
+        
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                client = pool.get(SERVER_IP, PORT, 30)
+                command = f"UPLOAD {filename} {filesize}".encode()
+                f.seek(0)
+                
+                if zstandard and (SERVER_IP, PORT) in pool.zstd and filesize >= COMPRESS_MIN_SIZE:
+                    # Compression needs the contents in memory; the file
+                    # goes out as a compressed frame behind the command
+                    send_payload(client, command, f.read(filesize), compress=True)
+                else:
+                    send_payload(client, command)
+                    
+                    # Send file data right behind the command, as one frame
+                    client.sendall(FRAME_HEADER.pack(0, filesize, FRAME_FLAGS))
                     sent = 0
                     while sent < filesize:
-                        chunk = f.read(4096)
-                        client.send(chunk)
+                        chunk = f.read(min(4096, filesize - sent))
+                        if not chunk:
+                            raise OSError("File shrank while it was being uploaded")
+                        client.sendall(chunk)  # send() may write only part of the chunk
                         sent += len(chunk)
                 
-                result = client.recv(1024).decode()
-                client.close()
+                result, flags = recv_frame(client)
+                result = result.decode(errors="replace")
+                if flags & FLAG_ACCEPTS_ZSTD:
+                    pool.zstd.add((SERVER_IP, PORT))
                 invalidate_cache(filename)
                 return result
-            else:
-                client.close()
-                return f"ERROR: {response}"
-        
-        except Exception as e:
-            print(f"[!] Upload attempt {attempt + 1} failed: {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        finally:
-            try:
-                client.close()
-            except:
-                pass
+            
+            except Exception as e:
+                pool.discard(SERVER_IP, PORT)
+                print(f"[!] Upload attempt {attempt + 1} failed: {str(e)}")
+                if attempt < max_retries - 1:
+                    time.sleep(2)
     
     return "ERROR: Could not upload file after multiple attempts"
 
@@ -178,48 +389,33 @@ def download_file(filename, save_path=None):
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client.settimeout(30)
-            client.connect((SERVER_IP, PORT))
+            client = pool.get(SERVER_IP, PORT, 30)
             
-            client.send(f"DOWNLOAD {filename}".encode())
-            response = client.recv(1024).decode()
+            send_payload(client, f"DOWNLOAD {filename}".encode())
+            response = recv_payload(client).decode(errors="replace")
             
             if response.startswith("READY"):
                 _, filesize = response.split()
                 filesize = int(filesize)
                 
-                client.send("ACK".encode())
-                
-                # Receive file data
-                received = 0
-                file_data = b""
-                while received < filesize:
-                    chunk = client.recv(min(4096, filesize - received))
-                    if not chunk:
-                        break
-                    file_data += chunk
-                    received += len(chunk)
+                # Receive file data, which follows the header as its own frame
+                file_data = recv_payload(client)
+                if len(file_data) != filesize:
+                    raise ValueError(f"Expected {filesize} bytes but received {len(file_data)}")
                 
                 # Save to local file
                 with open(save_path, "wb") as f:
                     f.write(file_data)
                 
-                client.close()
                 return f"Download successful: {filename} ({filesize} bytes) saved to {save_path}"
             else:
-                client.close()
                 return response
         
         except Exception as e:
+            pool.discard(SERVER_IP, PORT)
             print(f"[!] Download attempt {attempt + 1} failed: {str(e)}")
             if attempt < max_retries - 1:
                 time.sleep(2)
-        finally:
-            try:
-                client.close()
-            except:
-                pass
     
     return "ERROR: Could not download file after multiple attempts"
 
@@ -244,10 +440,11 @@ while True:
     cmd = input("\n>> ").strip()
 
     if cmd == "EXIT":
+        pool.close_all()
         break
     
     elif cmd == "CACHE":
-        cache = load_cache()
+        cache = CACHE.snapshot()
         if cache:
             print("\n--- Cached Files ---")
             for filename, info in cache.items():
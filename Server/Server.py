@@ -1,284 +1,768 @@
 import socket
 import os
+import json
+import struct
 import threading
 import time
+import queue
+import select
+import selectors
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard  # optional: compresses large payloads on the wire
+except ImportError:
+    zstandard = None
 
 # ---------------- CONFIG ----------------
 SERVER_IP = "0.0.0.0"
 PORT = 9000
 STORAGE_DIR = "Storage"
+MAX_WORKERS = (os.cpu_count() or 1) * 4  # commands served concurrently
+IDLE_TIMEOUT = 30  # seconds an idle client connection is kept open
+IDLE_SWEEP_INTERVAL = 5  # seconds between scans for idle connections
+REPLICATION_RETRIES = 3  # failed attempts before queued replications are dropped
+REPLICATION_RETRY_DELAY = 0.5  # seconds before the first retry, doubling each time
+BATCH_MAX_OPS = 16  # replication operations sent to the backup as one batch
+BATCH_WINDOW = 0.002  # seconds the sender waits for more operations to batch
+BACKUP_SEND_TIMEOUT = 10  # seconds a send to the backup may stall before the connection is dropped
+MAX_QUEUED = 10000  # replication operations held for the backup before new ones are dropped
+LOCK_SHARDS = 64  # independent sections of the file lock table
+LIST_CACHE_TTL = 1  # seconds a LIST reply is reused if nothing invalidates it
+CHUNK_SIZE = 64 * 1024  # bytes per socket recv
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # SO_RCVBUF/SO_SNDBUF for data sockets
+FRAME_HEADER = struct.Struct("!IQB")  # sequence number, length and flags before every message and payload
+FLAG_ZSTD = 1  # the frame's payload is zstd-compressed
+FLAG_ACCEPTS_ZSTD = 2  # the sender can decode zstd-compressed payloads
+COMPRESS_MIN_SIZE = 16 * 1024  # smaller payloads are sent as they are
+COMPRESS_LEVEL = 3  # zstd level: fast, and still shrinks text several times
+MAX_FRAME_SIZE = 1024 * 1024 * 1024  # largest command, payload or file body accepted
+FILE_BUFFER_SIZE = 1024 * 1024  # buffer for reading and writing stored files
+DURABILITY = "fdatasync"  # "fdatasync" syncs every write before replying, "none" leaves it to the OS
+DONTNEED_SIZE = 64 * 1024 * 1024  # synced files this large are dropped from the page cache
+TEMP_SUFFIX = ".dfstmp"  # marks files still being written
 BACKUP_SERVER_IP = "127.0.0.1"
 BACKUP_PORT = 9001
+HAVE_SENDMSG = hasattr(socket.socket, "sendmsg")  # vectored send, missing on Windows
+FRAME_FLAGS = FLAG_ACCEPTS_ZSTD if zstandard else 0  # set on every frame sent
+fdatasync = getattr(os, "fdatasync", os.fsync)  # fdatasync is missing on macOS and Windows
+O_BINARY = getattr(os, "O_BINARY", 0)  # Windows would otherwise translate newlines
 
 os.makedirs(STORAGE_DIR, exist_ok=True)
-
-# File locks (for concurrency control)
-file_locks = {}
-
-def get_lock(filename):
-    if filename not in file_locks:
-        file_locks[filename] = threading.Lock()
-    return file_locks[filename]
-
-# ---------------- REPLICATION ----------------
-def replicate_to_backup(filename, data):
-    """Send text file to backup server for replication"""
-    max_retries = 3
-    retry_delay = 2
-    
-    for attempt in range(max_retries):
+STORAGE_REAL = os.path.realpath(STORAGE_DIR)  # resolved once, not per request
+
+class RWLock:
+    """Lock that admits many readers at once but gives a writer exclusive access"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.writers_waiting = 0  # new readers wait behind these so writers are not starved
+
+    @contextmanager
+    def read_lock(self):
+        with self.cond:
+            while self.writer or self.writers_waiting:
+                self.cond.wait()
+            self.readers += 1
         try:
-            backup_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            backup_socket.settimeout(5)
-            backup_socket.connect((BACKUP_SERVER_IP, BACKUP_PORT))
-            
-            backup_socket.send(f"REPLICATE {filename}".encode())
-            response = backup_socket.recv(1024).decode()
-            
-            if response == "READY":
-                backup_socket.send(data.encode())
-                backup_socket.send("<<EOF>>".encode())
-                result = backup_socket.recv(1024).decode()
-                backup_socket.close()
-                print(f"[+] File replicated to backup: {filename}")
-                return True
-        
-        except Exception as e:
-            print(f"[!] Replication attempt {attempt + 1} failed: {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-        
+            yield
         finally:
-            try:
-                backup_socket.close()
-            except:
-                pass
-    
-    print(f"[!] Failed to replicate {filename} after {max_retries} attempts")
-    return False
-
-def replicate_binary(filename, data):
-    """Send binary file to backup server for replication"""
-    try:
-        backup_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        backup_socket.settimeout(5)
-        backup_socket.connect((BACKUP_SERVER_IP, BACKUP_PORT))
-        
-        backup_socket.send(f"REPLICATE_BINARY {filename} {len(data)}".encode())
-        response = backup_socket.recv(1024).decode()
-        
-        if response == "READY":
-            backup_socket.sendall(data)  # Send binary data
-            result = backup_socket.recv(1024).decode()
-            backup_socket.close()
-            print(f"[+] Binary file replicated to backup: {filename}")
-            return True
-    except Exception as e:
-        print(f"[!] Binary replication failed: {str(e)}")
-        return False
+            with self.cond:
+                self.readers -= 1
+                if not self.readers:
+                    self.cond.notify_all()
+
+    @contextmanager
+    def write_lock(self):
+        with self.cond:
+            self.writers_waiting += 1
+            while self.writer or self.readers:
+                self.cond.wait()
+            self.writers_waiting -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.writer = False
+                self.cond.notify_all()
 
-# ---------------- CLIENT HANDLER ----------------
-def handle_client(client_socket, addr):
-    print(f"[+] Client connected: {addr}")
+# File locks (for concurrency control): READ and DOWNLOAD share a file,
+# WRITE, APPEND, UPLOAD and DELETE get it to themselves. The table is split
+# into shards so that lookups for different files touch different dicts.
+file_lock_shards = [{} for _ in range(LOCK_SHARDS)]
 
+def get_lock(filename):
+    locks = file_lock_shards[hash(filename) % LOCK_SHARDS]
+    lock = locks.get(filename)
+    if lock is None:
+        # setdefault is atomic, so threads racing to create the lock all
+        # get the one that was stored first
+        lock = locks.setdefault(filename, RWLock())
+    return lock
+
+# Compact JSON encoder for LIST, built once rather than on every call
+encode_json = json.JSONEncoder(separators=(",", ":")).encode
+
+# LIST reply as (time built, bytes), reused until it expires or a WRITE,
+# APPEND, UPLOAD or DELETE drops it
+listing_cache = None
+
+def get_listing():
+    """Return the JSON list of stored file names, rebuilding it when stale"""
+    global listing_cache
+    cached = listing_cache
+    if cached is not None and time.time() - cached[0] < LIST_CACHE_TTL:
+        return cached[1]
+    # scandir yields names straight from the directory, with no stat per file
+    with os.scandir(STORAGE_DIR) as entries:
+        names = [entry.name for entry in entries if not entry.name.endswith(TEMP_SUFFIX)]
+    data = encode_json(names).encode()
+    listing_cache = (time.time(), data)
+    return data
+
+def invalidate_listing():
+    global listing_cache
+    listing_cache = None
+
+def resolve_path(filename):
+    """Return the storage path for filename, refusing names that escape STORAGE_DIR"""
+    filepath = os.path.realpath(os.path.join(STORAGE_REAL, filename))
+    if not filepath.startswith(STORAGE_REAL + os.sep):
+        raise ValueError(f"Invalid filename: {filename}")
+    return filepath
+
+def sync_dir(path):
+    """Flush a directory's entries to disk, where directories can be opened"""
     try:
-        # Set timeout for client operations
-        client_socket.settimeout(30)
-        
-        command = client_socket.recv(1024).decode().strip()
-
-        # -------- LIST --------
-        if command == "LIST":
-            files = os.listdir(STORAGE_DIR)
-            client_socket.send(str(files).encode())
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # Windows cannot open a directory this way
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
-        # -------- READ --------
-        elif command.startswith("READ"):
-            _, filename = command.split()
-            filepath = os.path.join(STORAGE_DIR, filename)
+def write_atomic(filepath, data):
+    """Write data to a temp file and rename it over filepath, so readers
+    only ever see the old or the new contents"""
+    tmp = f"{filepath}.{threading.get_ident()}{TEMP_SUFFIX}"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        if DURABILITY == "fdatasync":
+            # The reply is only sent once the data is on disk
+            fdatasync(fd)
+            if len(data) >= DONTNEED_SIZE and hasattr(os, "posix_fadvise"):
+                # The pages are clean now; let large files leave the page cache
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except BaseException:
+        os.close(fd)
+        os.remove(tmp)
+        raise
+    os.close(fd)
+    os.replace(tmp, filepath)
+    if DURABILITY == "fdatasync":
+        # The rename is only durable once the directory entry is on disk too
+        sync_dir(os.path.dirname(filepath))
+
+def tune_socket(sock):
+    """Enlarge kernel socket buffers and disable Nagle's algorithm"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if hasattr(socket, "TCP_QUICKACK"):
+        # Linux only: acknowledge small commands and replies straight away
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+def recv_exact(rfile, size):
+    """Read exactly size bytes from a buffered socket reader"""
+    # readinto() keeps reading until the buffer is full, so short reads
+    # from the socket never leak out as partial messages
+    buf = bytearray(size)
+    if rfile.readinto(buf) != size:
+        raise ConnectionError("Connection closed before all data was received")
+    return buf
+
+def encode_payload(data, peer_accepts_zstd):
+    """Return the bytes to send for data and the frame flags describing them"""
+    if zstandard and peer_accepts_zstd and len(data) >= COMPRESS_MIN_SIZE:
+        packed = zstandard.ZstdCompressor(level=COMPRESS_LEVEL).compress(data)
+        if len(packed) < len(data):
+            return packed, FRAME_FLAGS | FLAG_ZSTD
+    return data, FRAME_FLAGS
+
+def decode_payload(payload, flags):
+    """Undo the compression described by a frame's flags"""
+    if not flags & FLAG_ZSTD:
+        return payload
+    if zstandard is None:
+        raise ValueError("Received a compressed payload but zstandard is not installed")
+    # Our compressed frames always record their size; check it before allocating
+    size = zstandard.frame_content_size(payload)
+    if not 0 <= size <= MAX_FRAME_SIZE:
+        raise ValueError("Compressed payload has a missing or oversized content size")
+    try:
+        return zstandard.ZstdDecompressor().decompress(payload)
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Invalid compressed payload: {str(e)}")
+
+def recv_frame(rfile):
+    """Receive a frame and return its sequence number, payload and flags"""
+    seq, size, flags = FRAME_HEADER.unpack(recv_exact(rfile, FRAME_HEADER.size))
+    if size > MAX_FRAME_SIZE:
+        # Not a frame from our clients; the stream cannot be resynchronised
+        raise ConnectionError(f"Frame of {size} bytes exceeds limit")
+    return seq, decode_payload(recv_exact(rfile, size), flags), flags
+
+def recv_payload(rfile):
+    """Receive a frame and return only its payload"""
+    return recv_frame(rfile)[1]
+
+def split_sized(args):
+    """Split "<filename> <size>" arguments of a command followed by a body"""
+    # The size is the last word, so it is found even if the name has spaces
+    filename, _, size = args.rpartition(" ")
+    try:
+        return filename, int(size)
+    except ValueError:
+        # Without a valid size the body cannot be skipped, so the stream
+        # cannot be resynchronised
+        raise ConnectionError(f"Invalid body size: {size!r}")
+
+def recv_file(rfile, size):
+    """Receive a file sent as one frame after its command, size being its
+    uncompressed length as given in the command"""
+    if not 0 <= size <= MAX_FRAME_SIZE:
+        # Checked before the buffer is allocated; the body cannot be
+        # skipped without reading it, so the stream cannot be resynchronised
+        raise ConnectionError(f"Body of {size} bytes exceeds limit")
+    data = recv_payload(rfile)
+    if len(data) != size:
+        raise ValueError(f"Expected {size} bytes but received {len(data)}")
+    return data
+
+# Sequence number of the command each worker thread is serving, and
+# whether its sender accepts compressed replies. Replies echo the sequence
+# number so a client can send several commands before reading any reply.
+current = threading.local()
+
+def send_payload(sock, data):
+    """Send a payload prefixed with the current sequence number and its length"""
+    data, flags = encode_payload(data, getattr(current, "accepts_zstd", False))
+    header = FRAME_HEADER.pack(getattr(current, "seq", 0), len(data), flags)
+    send_buffers(sock, [header, data])
+
+def send_buffers(sock, buffers, timeout=None):
+    """Send several buffers back to back, giving up if the peer stops reading for timeout seconds"""
+    if not HAVE_SENDMSG:
+        # Without sendmsg there is no way to send only what fits, so no timeout either
+        sock.sendall(b"".join(buffers))
+        return
+    
+    # Gather the buffers into one syscall without first copying them
+    # into a new buffer; loop in case only part is sent
+    buffers = [memoryview(buf) for buf in buffers]
+    while buffers:
+        if timeout is None:
+            sent = sock.sendmsg(buffers)
+        else:
+            # Wait for room in the send buffer, then send only what fits
+            if not select.select([], [sock], [], timeout)[1]:
+                raise socket.timeout(f"send stalled for {timeout}s")
+            try:
+                sent = sock.sendmsg(buffers, [], socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                sent = 0
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if buffers:
+            buffers[0] = buffers[0][sent:]
+
+def send_file(sock, f):
+    """Send the contents of an open file as one frame without reading it into memory"""
+    size = os.fstat(f.fileno()).st_size
+    if zstandard and getattr(current, "accepts_zstd", False) and size >= COMPRESS_MIN_SIZE:
+        # Compression needs the contents in memory, so skip the zero-copy send
+        send_payload(sock, f.read())
+        return
+    sock.sendall(FRAME_HEADER.pack(getattr(current, "seq", 0), size, FRAME_FLAGS))
+    sock.sendfile(f, 0, size)
 
-            if not os.path.exists(filepath):
-                client_socket.send("ERROR: File not found".encode())
+# ---------------- REPLICATION ----------------
+class BackupChannel:
+    """Persistent, ordered replication stream to the backup server.
+
+    Handlers only queue operations. One sender thread writes them back to
+    back over a single connection, gathering operations that arrive close
+    together into one REPLICATE_BATCH message, and a reader thread matches
+    the backup's replies to them in order. Operations the backup has not
+    confirmed are sent again after a reconnect; each one is idempotent
+    (a full file or a delete), so a repeat is harmless."""
+
+    def __init__(self, server_ip, port):
+        self.addr = (server_ip, port)
+        self.queue = queue.Queue()  # (buffers, description); None wakes the sender
+        self.sock = None
+        self.unacked = deque()  # batches sent on the current connection, awaiting a reply
+        self.outstanding = 0  # queued or unconfirmed operations
+        self.lock = threading.Lock()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    # -------- Operations --------
+    def replicate(self, filename, data):
+        """Queue a file's contents (bytes, text or binary alike) for replication"""
+        command = f"REPLICATE {filename} {len(data)}".encode()
+        # The raw bytes follow the command as they are, with no re-encoding
+        self.submit([FRAME_HEADER.pack(0, len(command), FRAME_FLAGS), command, data], f"file {filename}")
+
+    def delete(self, filename):
+        """Queue the removal of a file from the backup"""
+        command = f"DELETE {filename}".encode()
+        self.submit([FRAME_HEADER.pack(0, len(command), FRAME_FLAGS), command], f"delete of {filename}")
+
+    def submit(self, buffers, description):
+        with self.lock:
+            if self.outstanding >= MAX_QUEUED:
+                # Each operation holds a whole file, so an unreachable backup must not exhaust memory
+                print(f"[!] Replication queue full ({MAX_QUEUED} operations); dropping {description}")
                 return
-
-            lock = get_lock(filename)
-            with lock:
-                with open(filepath, "r") as f:
-                    data = f.read()
-
-            client_socket.send(data.encode())
-
-        # -------- WRITE --------
-        elif command.startswith("WRITE"):
-            _, filename = command.split()
-            filepath = os.path.join(STORAGE_DIR, filename)
-
-            lock = get_lock(filename)
-
-            # Tell client server is ready
-            client_socket.send("READY".encode())
-
-            data = ""
-            while True:
-                chunk = client_socket.recv(4096).decode()
-                if chunk == "<<EOF>>":
+            self.outstanding += 1
+        self.queue.put((buffers, description))
+
+    def wait_idle(self, timeout):
+        """Wait up to timeout seconds for every queued operation to be confirmed"""
+        deadline = time.time() + timeout
+        while self.outstanding and time.time() < deadline:
+            time.sleep(0.1)
+        return not self.outstanding
+
+    # -------- Sender --------
+    def run(self):
+        """Sender thread: write queued operations, reconnecting with backoff"""
+        backlog = []  # operations still to be written, oldest first
+        failures = 0
+        while True:
+            item = self.queue.get()
+            if item is not None:
+                backlog.append(item)
+            # Give operations arriving right behind this one a moment to join its batch
+            deadline = time.time() + BATCH_WINDOW
+            while len(backlog) < BATCH_MAX_OPS:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
                     break
-                data += chunk
-
-            with lock:
-                with open(filepath, "w") as f:
-                    f.write(data)
-
-            # Replicate to backup server
-            threading.Thread(target=replicate_to_backup, args=(filename, data)).start()
-
-            client_socket.send("Write successful (replicated to backup)".encode())
-
-        # -------- APPEND --------
-        elif command.startswith("APPEND"):
-            _, filename = command.split()
-            filepath = os.path.join(STORAGE_DIR, filename)
-
-            lock = get_lock(filename)
-
-            # Tell client server is ready
-            client_socket.send("READY".encode())
-
-            data = ""
+                if item is not None:
+                    backlog.append(item)
             while True:
-                chunk = client_socket.recv(4096).decode()
-                if chunk == "<<EOF>>":
+                try:
+                    self.flush(backlog)
+                    failures = 0
                     break
-                data += chunk
-
-            with lock:
-                with open(filepath, "a") as f:  # "a" mode appends
-                    f.write(data)
-                
-                # Read entire file for replication
-                with open(filepath, "r") as f:
-                    full_content = f.read()
-
-            # Replicate entire file to backup server
-            threading.Thread(target=replicate_to_backup, args=(filename, full_content)).start()
-
-            client_socket.send("Append successful (replicated to backup)".encode())
-
-        # -------- DELETE --------
-        elif command.startswith("DELETE"):
-            _, filename = command.split()
-            filepath = os.path.join(STORAGE_DIR, filename)
-
-            if not os.path.exists(filepath):
-                client_socket.send("ERROR: File not found".encode())
+                except OSError as e:
+                    self.disconnect(self.sock)
+                    failures += 1
+                    if failures >= REPLICATION_RETRIES:
+                        self.give_up(backlog)
+                        failures = 0
+                        break
+                    delay = REPLICATION_RETRY_DELAY * 2 ** (failures - 1)
+                    print(f"[!] Replication attempt {failures} failed: {str(e)}; retrying in {delay}s")
+                    time.sleep(delay)
+
+    def flush(self, backlog):
+        """Write every operation in backlog, reconnecting first if needed"""
+        with self.lock:
+            sock = self.sock
+            if sock is None:
+                # Whatever the lost connection did not confirm goes out again first
+                backlog[:0] = [op for batch in self.unacked for op in batch]
+                self.unacked.clear()
+        if sock is None:
+            if not backlog:
+                return
+            sock = self.connect()
+        while backlog:
+            batch = backlog[:BATCH_MAX_OPS]
+            del backlog[:BATCH_MAX_OPS]
+            buffers = [buf for op_buffers, _ in batch for buf in op_buffers]
+            if len(batch) > 1:
+                # The backup applies the whole batch and answers it with one reply
+                command = f"REPLICATE_BATCH {len(batch)}".encode()
+                buffers[:0] = [FRAME_HEADER.pack(0, len(command), FRAME_FLAGS), command]
+            with self.lock:
+                self.unacked.append(batch)
+            send_buffers(sock, buffers, BACKUP_SEND_TIMEOUT)
+
+    def give_up(self, backlog):
+        """Drop operations the backup could not be reached for"""
+        with self.lock:
+            dropped = [op for batch in self.unacked for op in batch] + backlog
+            self.unacked.clear()
+            self.outstanding -= len(dropped)
+        backlog.clear()
+        for _, description in dropped:
+            print(f"[!] Failed to replicate {description} after {REPLICATION_RETRIES} attempts")
+
+    # -------- Connection --------
+    def connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tune_socket(sock)
+        # Notice a backup that vanished without closing the connection
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.settimeout(5)
+        sock.connect(self.addr)
+        # The reader thread waits indefinitely for the next reply; sends
+        # are bounded by BACKUP_SEND_TIMEOUT instead
+        sock.settimeout(None)
+        with self.lock:
+            self.sock = sock
+        rfile = sock.makefile("rb", buffering=CHUNK_SIZE)
+        threading.Thread(target=self.read_replies, args=(sock, rfile), daemon=True).start()
+        return sock
+
+    def disconnect(self, sock):
+        with self.lock:
+            if sock is None or self.sock is not sock:
                 return
+            self.sock = None
+        try:
+            # Wakes the reader thread, which closes the socket
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
 
-            lock = get_lock(filename)
-            with lock:
-                os.remove(filepath)
-            
-            # Delete from backup server too
-            try:
-                backup_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                backup_socket.settimeout(5)
-                backup_socket.connect((BACKUP_SERVER_IP, BACKUP_PORT))
-                backup_socket.send(f"DELETE {filename}".encode())
-                backup_response = backup_socket.recv(1024).decode()
-                backup_socket.close()
-                print(f"[+] File deleted from backup: {filename}")
-            except Exception as e:
-                print(f"[!] Failed to delete from backup: {str(e)}")
-            
-            client_socket.send("Delete successful (removed from main and backup)".encode())
-            print(f"[+] File deleted: {filename} by {addr}")
-
-        # -------- UPLOAD --------
-        elif command.startswith("UPLOAD"):
-            _, filename, filesize = command.split()
-            filesize = int(filesize)
-            filepath = os.path.join(STORAGE_DIR, filename)
-
-            lock = get_lock(filename)
-            client_socket.send("READY".encode())
-
-            # Receive file data
-            received = 0
-            file_data = b""
-            while received < filesize:
-                chunk = client_socket.recv(min(4096, filesize - received))
-                if not chunk:
+    def read_replies(self, sock, rfile):
+        """Reader thread: confirm queued operations as the backup answers them"""
+        try:
+            while True:
+                reply = recv_payload(rfile).decode()
+                with self.lock:
+                    batch = self.unacked.popleft()
+                    # A batch reply holds one result line per operation
+                    results = reply.split("\n") if len(batch) > 1 else [reply]
+                    done = batch[:len(results)]
+                    if len(done) < len(batch):
+                        # Operations without a result stay unconfirmed, ahead
+                        # of everything sent after them
+                        self.unacked.appendleft(batch[len(done):])
+                    self.outstanding -= len(done)
+                for (_, description), result in zip(done, results):
+                    if result.startswith("ERROR"):
+                        print(f"[!] Backup rejected {description}: {result}")
+                    else:
+                        print(f"[+] Replicated {description} to backup")
+                if len(done) < len(batch):
+                    # Later replies can no longer be matched to their batches;
+                    # reconnecting resends everything unconfirmed, in order
+                    print(f"[!] Backup answered {len(done)} of {len(batch)} operations: {reply!r}")
                     break
-                file_data += chunk
-                received += len(chunk)
-
-            with lock:
-                with open(filepath, "wb") as f:
-                    f.write(file_data)
-
-            # Replicate binary data to backup server
-            threading.Thread(target=replicate_binary, args=(filename, file_data)).start()
-
-            client_socket.send(f"Upload successful: {filename} ({filesize} bytes) - replicated to backup".encode())
-            print(f"[+] File uploaded: {filename} ({filesize} bytes) from {addr}")
-
-        # -------- DOWNLOAD --------
-        elif command.startswith("DOWNLOAD"):
-            _, filename = command.split()
-            filepath = os.path.join(STORAGE_DIR, filename)
+        except (OSError, ValueError):
+            pass  # backup closed the connection or the sender shut it down
+        finally:
+            self.disconnect(sock)
+            rfile.close()
+            sock.close()
+            # Let the sender resend anything that was not confirmed
+            if self.unacked:
+                self.queue.put(None)
 
-            if not os.path.exists(filepath):
-                client_socket.send("ERROR: File not found".encode())
+# ---------------- CLIENT HANDLER ----------------
+def open_stored(filename):
+    """Open a stored file for reading, or return None if it does not exist"""
+    filepath = resolve_path(filename)
+    # Writers swap in a new file with os.replace, so an open handle keeps
+    # one complete version; the lock only has to cover the open, and a
+    # slow client never holds it while its reply is sent
+    with get_lock(filename).read_lock():
+        try:
+            return open(filepath, "rb")
+        except FileNotFoundError:
+            return None
+
+# -------- LIST --------
+def handle_list(client_socket, rfile, args, addr):
+    """Send the names of all stored files"""
+    send_payload(client_socket, get_listing())
+
+# -------- READ --------
+def handle_read(client_socket, rfile, args, addr):
+    """Send a file's contents"""
+    [filename] = args.split()
+    f = open_stored(filename)
+    if f is None:
+        send_payload(client_socket, "ERROR: File not found".encode())
+        return
+
+    # The bytes go out exactly as stored, straight from the page
+    # cache, with no decode/encode round trip
+    with f:
+        send_file(client_socket, f)
+
+# -------- WRITE --------
+def handle_write(client_socket, rfile, args, addr):
+    """Replace a file with the received text"""
+    # The text follows the command directly; read it before anything
+    # can fail so the next command starts at a frame boundary
+    data = recv_payload(rfile)
+
+    [filename] = args.split()
+    filepath = resolve_path(filename)
+
+    lock = get_lock(filename)
+
+    with lock.write_lock():
+        write_atomic(filepath, data)
+        # Queued under the lock so the backup applies writes to this file
+        # in the same order as the main server
+        backup.replicate(filename, data)
+    invalidate_listing()
+
+    send_payload(client_socket, "Write successful (replicated to backup)".encode())
+
+# -------- APPEND --------
+def handle_append(client_socket, rfile, args, addr):
+    """Add the received text to the end of a file"""
+    # The text follows the command directly
+    data = recv_payload(rfile)
+
+    [filename] = args.split()
+    filepath = resolve_path(filename)
+
+    lock = get_lock(filename)
+
+    with lock.write_lock():
+        # Rewrite the whole file so a crash never leaves half an append;
+        # the full contents are needed for replication anyway
+        try:
+            with open(filepath, "rb", buffering=FILE_BUFFER_SIZE) as f:
+                full_content = f.read() + data
+        except FileNotFoundError:
+            full_content = data
+        write_atomic(filepath, full_content)
+        # Replicate entire file to backup server, in order with other writes
+        backup.replicate(filename, full_content)
+    invalidate_listing()
+
+    send_payload(client_socket, "Append successful (replicated to backup)".encode())
+
+# -------- DELETE --------
+def handle_delete(client_socket, rfile, args, addr):
+    """Remove a file from the main and backup servers"""
+    [filename] = args.split()
+    filepath = resolve_path(filename)
+
+    lock = get_lock(filename)
+    with lock.write_lock():
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            send_payload(client_socket, "ERROR: File not found".encode())
+            return
+        # Delete from backup server too, in order with earlier replications
+        backup.delete(filename)
+    invalidate_listing()
+
+    send_payload(client_socket, "Delete successful (removed from main and backup)".encode())
+    print(f"[+] File deleted: {filename} by {addr}")
+
+# -------- UPLOAD --------
+def handle_upload(client_socket, rfile, args, addr):
+    """Receive a binary file of a known size"""
+    filename, filesize = split_sized(args)
+
+    # The file data follows the command as one frame, compressed if the
+    # client knows we accept that. Read it through the same buffered
+    # reader, since it may already hold the start of the body
+    file_data = recv_file(rfile, filesize)
+
+    filepath = resolve_path(filename)
+    lock = get_lock(filename)
+
+    with lock.write_lock():
+        write_atomic(filepath, file_data)
+        # Replicate binary data to backup server, in order with other writes
+        backup.replicate(filename, file_data)
+    invalidate_listing()
+
+    send_payload(client_socket, f"Upload successful: {filename} ({filesize} bytes) - replicated to backup".encode())
+    print(f"[+] File uploaded: {filename} ({filesize} bytes) from {addr}")
+
+# -------- DOWNLOAD --------
+def handle_download(client_socket, rfile, args, addr):
+    """Send a file's size followed by its contents as one frame"""
+    [filename] = args.split()
+    f = open_stored(filename)
+    if f is None:
+        send_payload(client_socket, "ERROR: File not found".encode())
+        return
+
+    with f:
+        filesize = os.fstat(f.fileno()).st_size
+        send_payload(client_socket, f"READY {filesize}".encode())
+
+        # The file data follows as its own frame: compressed if the client
+        # accepts that, otherwise a zero-copy transfer from the page cache
+        send_file(client_socket, f)
+
+    print(f"[+] File downloaded: {filename} ({filesize} bytes) by {addr}")
+
+def handle_invalid(client_socket, rfile, args, addr):
+    """Reject an unknown command"""
+    send_payload(client_socket, "ERROR: Invalid command".encode())
+
+HANDLERS = {
+    "LIST": handle_list,
+    "READ": handle_read,
+    "WRITE": handle_write,
+    "APPEND": handle_append,
+    "DELETE": handle_delete,
+    "UPLOAD": handle_upload,
+    "DOWNLOAD": handle_download,
+}
+
+def handle_command(client_socket, rfile, command, addr):
+    """Run a single command received from a client"""
+    verb, _, args = command.partition(" ")
+    handler = HANDLERS.get(verb, handle_invalid)
+    handler(client_socket, rfile, args, addr)
+
+def serve_commands(client_socket, rfile, addr):
+    """Worker: run the commands that have arrived on a connection, then
+    hand it back to the selector loop to wait for more"""
+    try:
+        # The rest of a command that has started to arrive must follow promptly
+        client_socket.settimeout(30)
+        
+        # Serve every command already received, including ones the
+        # buffered reader holds but the selector cannot see
+        while True:
+            try:
+                current.seq, command, flags = recv_frame(rfile)
+            except (ConnectionError, socket.timeout):
+                close_client(client_socket, rfile, addr)  # client disconnected
                 return
-
-            lock = get_lock(filename)
-            with lock:
-                filesize = os.path.getsize(filepath)
-                client_socket.send(f"READY {filesize}".encode())
-                
-                # Wait for client acknowledgment
-                ack = client_socket.recv(1024).decode()
-                if ack == "ACK":
-                    with open(filepath, "rb") as f:
-                        while True:
-                            chunk = f.read(4096)
-                            if not chunk:
-                                break
-                            client_socket.send(chunk)
-            
-            print(f"[+] File downloaded: {filename} ({filesize} bytes) by {addr}")
-
-        else:
-            client_socket.send("ERROR: Invalid command".encode())
+            current.accepts_zstd = bool(flags & FLAG_ACCEPTS_ZSTD)
+            command = command.decode().strip()
+            try:
+                handle_command(client_socket, rfile, command, addr)
+            except ValueError as e:
+                # Malformed arguments or a filename outside STORAGE_DIR
+                send_payload(client_socket, f"ERROR: {str(e)}".encode())
+            if not command_waiting(client_socket, rfile):
+                break
 
     except socket.timeout:
         print(f"[!] Client timeout: {addr}")
         try:
-            client_socket.send("ERROR: Connection timeout".encode())
+            send_payload(client_socket, "ERROR: Connection timeout".encode())
         except:
             pass
+        close_client(client_socket, rfile, addr)
+        return
     
     except ConnectionResetError:
         print(f"[!] Connection reset by client: {addr}")
+        close_client(client_socket, rfile, addr)
+        return
     
     except Exception as e:
         print(f"[!] Error handling client {addr}: {str(e)}")
         try:
-            client_socket.send(f"ERROR: {str(e)}".encode())
+            send_payload(client_socket, f"ERROR: {str(e)}".encode())
         except:
             pass
+        close_client(client_socket, rfile, addr)
+        return
 
+    hand_back(client_socket, rfile, addr)
+
+def command_waiting(client_socket, rfile):
+    """Return True if more of the next command is already available, without blocking"""
+    client_socket.settimeout(0)
+    try:
+        # Returns buffered bytes, or whatever one non-blocking read finds
+        return bool(rfile.peek(1))
     finally:
+        client_socket.settimeout(30)
+
+def close_client(client_socket, rfile, addr):
+    try:
+        rfile.close()
+        client_socket.close()
+    except:
+        pass
+    print(f"[-] Client disconnected: {addr}")
+
+# ---------------- CONNECTION LOOP ----------------
+# One thread waits on the listening socket and on every idle connection.
+# A connection only takes a worker while it has commands to run, so idle
+# clients do not tie up the pool.
+selector = selectors.DefaultSelector()
+returning = queue.SimpleQueue()  # (socket, rfile, addr) handed back by workers
+wake_r, wake_w = socket.socketpair()  # lets workers interrupt select()
+wake_r.setblocking(False)
+wake_w.setblocking(False)
+
+def hand_back(client_socket, rfile, addr):
+    """Return a connection to the selector loop to wait for its next command"""
+    returning.put((client_socket, rfile, addr))
+    try:
+        wake_w.send(b"\0")
+    except BlockingIOError:
+        pass  # a wakeup is already pending
+
+def accept_clients():
+    """Accept every pending connection"""
+    while True:
         try:
-            client_socket.close()
-        except:
-            pass
-        print(f"[-] Client disconnected: {addr}")
+            client_socket, addr = server.accept()
+        except BlockingIOError:
+            return
+        tune_socket(client_socket)
+        print(f"[+] Client connected: {addr}")
+        # All reads go through one buffered reader, so a message split across
+        # several TCP segments is reassembled before it is parsed
+        rfile = client_socket.makefile("rb", buffering=CHUNK_SIZE)
+        selector.register(client_socket, selectors.EVENT_READ, (rfile, addr, time.time()))
+
+def register_returning():
+    """Start watching connections the workers have finished with"""
+    try:
+        while True:
+            wake_r.recv(4096)
+    except BlockingIOError:
+        pass
+    while not returning.empty():
+        client_socket, rfile, addr = returning.get()
+        selector.register(client_socket, selectors.EVENT_READ, (rfile, addr, time.time()))
+
+def close_idle():
+    """Close connections that have sent nothing for IDLE_TIMEOUT seconds"""
+    deadline = time.time() - IDLE_TIMEOUT
+    for key in list(selector.get_map().values()):
+        if key.data is not None and key.data[2] < deadline:
+            rfile, addr, _ = key.data
+            selector.unregister(key.fileobj)
+            close_client(key.fileobj, rfile, addr)
 
 # ---------------- SERVER SETUP ----------------
 server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+if hasattr(socket, "SO_REUSEPORT"):  # not available on Windows
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+tune_socket(server)  # buffer sizes must be set before listen() to be inherited
 server.bind((SERVER_IP, PORT))
-server.listen(5)
+server.listen(1024)  # deep accept queue so connection bursts are not refused
+server.setblocking(False)  # accepted in batches by the selector loop
 
 print("=" * 50)
 print("DFS MAIN SERVER RUNNING")
@@ -288,19 +772,36 @@ print(f"Listening on: {SERVER_IP}:{PORT}")
 print(f"Backup server: {BACKUP_SERVER_IP}:{BACKUP_PORT}")
 print("=" * 50)
 
+# Bounded pool of worker threads instead of one thread per connection
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+backup = BackupChannel(BACKUP_SERVER_IP, BACKUP_PORT)
+
+selector.register(server, selectors.EVENT_READ)
+selector.register(wake_r, selectors.EVENT_READ)
+last_sweep = time.time()
+
 while True:
     try:
-        client_socket, addr = server.accept()
-        client_thread = threading.Thread(
-            target=handle_client,
-            args=(client_socket, addr)
-        )
-        client_thread.daemon = True
-        client_thread.start()
+        for key, _ in selector.select(timeout=1):
+            if key.fileobj is server:
+                accept_clients()
+            elif key.fileobj is wake_r:
+                register_returning()
+            else:
+                # A command is arriving; a worker serves it and hands the connection back
+                rfile, addr, _ = key.data
+                selector.unregister(key.fileobj)
+                executor.submit(serve_commands, key.fileobj, rfile, addr)
+        # Scanning every connection is O(n), so only do it now and then
+        if time.time() - last_sweep >= IDLE_SWEEP_INTERVAL:
+            close_idle()
+            last_sweep = time.time()
     except KeyboardInterrupt:
         print("\n[!] Server shutting down...")
         break
     except Exception as e:
         print(f"[!] Server error: {str(e)}")
 
+executor.shutdown(wait=False, cancel_futures=True)
+backup.wait_idle(10)  # give queued replications a chance to reach the backup
 server.close()